@@ -1,22 +1,46 @@
 
+import io
 import os
 import sys
+import argparse
 import time
 import serial
 import serial.tools.list_ports
 import multiprocessing
 import socket
 import logging
-from flask import Flask, jsonify, request
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+import json
+from flask import Flask, Response, jsonify, request
+from werkzeug.serving import make_server
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QVBoxLayout, QHBoxLayout, QWidget, QPushButton, QLabel, QWidget, QStyle, QApplication, QLayout,
     QStackedWidget, QTableWidget, QTableWidgetItem, QLineEdit, QMessageBox, QHeaderView, QSpacerItem, QSizePolicy, QFrame, QItemDelegate
 )
-from PyQt5.QtCore import QTimer, Qt, QThread, pyqtSignal, QRect, QRectF, QSize, QUrl
+from PyQt5.QtCore import QTimer, Qt, QThread, pyqtSignal, QRect, QRectF, QSize, QUrl, QSettings
 from PyQt5.QtGui import QFont, QFontDatabase, QCursor, QBrush, QColor, QPainter, QPen, QPainterPath, QPalette, QDesktopServices
 from collections import deque
 
 import styles
+from line_parser import KeyValueParser
+from binary_protocol import BinaryDecoder, PROTOCOL_NAME, PROTOCOL_REQUEST
+from handshake import Handshake
+from write_scheduler import WriteScheduler
+from serial_capture import CaptureWriter, CapturedConnection, ReplaySerial
+from shared_snapshot import SnapshotStore
+from outgoing_channel import AtomicUpdate, OutgoingChannel
+from latency_histogram import LatencyHistogram
+from time_series import DEFAULT_CAPACITY, TimeSeriesStore
+from interval_stats import IntervalStats
+from staleness import StalenessEngine
+from ingest_filter import ChangeFilter
+from derived_channels import DerivedChannels, ExpressionError, parse_definitions
+from value_types import ChannelTypes, format_value, parse_value
+from update_stream import UpdateHub
+from response_cache import ResponseCache
+from websocket_link import CLOSE_GOING_AWAY, CLOSE_TRY_AGAIN, UpgradedResponse, upgrade
 
 
 class PortLineEdit(QLineEdit):
@@ -151,35 +175,277 @@ logging.basicConfig(
 # --------------------------------------------------------------------
 # Flask App
 # --------------------------------------------------------------------
-app = Flask(__name__)
+MAX_WAIT_MS = 30000  # longest a GET /?since=N&wait=ms is held
+NDJSON_MIMETYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+
+def validate_posted(data):
+    """Return why posted data can't be sent to the Arduino, or None if it can."""
+    if not data or not isinstance(data, dict):
+        return "Invalid data format. Expected a JSON object."
+    for key, value in data.items():
+        if key is None or value is None:
+            return "All keys and values must be non-null."
+    return None
+
+
+def ndjson_updates(stream):
+    """Yield (line_number, object or None if it isn't JSON) for each non-empty line of stream."""
+    for index, line in enumerate(stream):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield index, json.loads(line)
+        except ValueError:
+            yield index, None
+
+
+def compact_json(value):
+    return json.dumps(value, separators=(',', ':'))
 
-def run_flask_app(host, port, arduino_data, outgoing_data):
+
+def create_flask_app(snapshot, outgoing_data, status_snapshot=None):
     """
-    arduino_data: Manager dict storing data read from the Arduino.
-    outgoing_data: Manager list for posted data to send to Arduino.
+    snapshot: SharedSnapshot the GUI publishes the Arduino data to.
+    outgoing_data: OutgoingChannel for posted data to send to Arduino.
+    status_snapshot: SharedSnapshot of the stale channels, if the GUI publishes one.
     """
+    app = Flask(__name__)
+    hub = UpdateHub(snapshot)
+    app.extensions["update_hub"] = hub
+    cache = ResponseCache(snapshot)
+
     @app.route('/', methods=['GET', 'POST'])
     def dashboard_route():
         if request.method == 'GET':
-            # Return ONLY the data that came from Arduino
-            if not arduino_data:
+            if "since" in request.args:
+                return changes_route()
+            # Return ONLY the data that came from Arduino, already encoded by the GUI
+            etag, body, encoding = cache.get(request.accept_encodings["gzip"] > 0)
+            if not body:
                 return jsonify({"message": "No Arduino data available"}), 200
-            return jsonify(dict(arduino_data)), 200
+            response = app.response_class(body, mimetype="application/json")
+            response.set_etag(etag)
+            response.vary.add("Accept-Encoding")
+            if encoding:
+                response.content_encoding = encoding
+            # 304 without a body if If-None-Match already names this version
+            return response.make_conditional(request)
 
         elif request.method == 'POST':
             data = request.get_json()
-            if not data or not isinstance(data, dict):
-                return jsonify({"error": "Invalid data format. Expected a JSON object."}), 400
-
-            for key, value in data.items():
-                if key is None or value is None:
-                    return jsonify({"error": "All keys and values must be non-null."}), 400
+            error = validate_posted(data)
+            if error:
+                return jsonify({"error": error}), 400
 
-            # Add data to the outgoing list
+            # Hand the data to the GUI, which wakes up and writes it right away
             outgoing_data.append(data)
             return jsonify({"message": "Data received and queued to send to Arduino."}), 200
 
-    app.run(host=host, port=port, use_reloader=False)
+    def changes_route():
+        """
+        GET /?since=N returns {"version": V, "values": {...}} with only the
+        keys that changed after version N, plus "removed": [...] if keys
+        went away. Pass the returned version as the next since. since=0, or
+        a version from before the server started, returns every value with
+        "full": true instead. &wait=ms holds the request until something
+        changes or the time is up.
+        """
+        try:
+            since = int(request.args["since"])
+            wait_ms = int(request.args.get("wait", 0))
+        except ValueError:
+            return jsonify({"error": "since and wait must be integers."}), 400
+        if since < 0 or wait_ms < 0:
+            return jsonify({"error": "since and wait must not be negative."}), 400
+
+        version, values, removed, full = hub.changes_since(since, min(wait_ms, MAX_WAIT_MS) / 1000)
+        response = {"version": version, "values": values}
+        if full:
+            response["full"] = True
+        elif removed:
+            response["removed"] = removed
+        return jsonify(response), 200
+
+    @app.route('/stale', methods=['GET'])
+    def stale_route():
+        """The channels that are stale right now: {key: {"reason": ..., "since": ...}}."""
+        if status_snapshot is None:
+            return jsonify({"error": "Staleness is not published by this app."}), 404
+        _, body = status_snapshot.read()
+        return app.response_class(body or b"{}\n", mimetype="application/json"), 200
+
+    @app.route('/batch', methods=['POST'])
+    def batch_route():
+        """
+        Many updates in one request: a JSON array of objects, or one object
+        per line with Content-Type application/x-ndjson (read as it streams
+        in). Each update is checked like a POST to /. The valid ones are
+        merged, later values replacing earlier ones, and queued as a single
+        item. With ?atomic=1 one invalid update rejects the whole batch, and
+        the values reach each board together in one write, in order.
+        """
+        atomic = request.args.get("atomic", "").lower() in ("1", "true", "yes")
+        if request.mimetype in NDJSON_MIMETYPES:
+            # Buffered, or readline() pulls the body a byte at a time
+            updates = ndjson_updates(io.BufferedReader(request.stream))
+        else:
+            body = request.get_json(silent=True)
+            if not isinstance(body, list):
+                return jsonify({"error": "Expected a JSON array of objects or an NDJSON body."}), 400
+            updates = enumerate(body)
+
+        merged = AtomicUpdate() if atomic else {}
+        accepted = 0
+        values = 0
+        rejected = []
+        for index, data in updates:
+            error = validate_posted(data)
+            if error:
+                rejected.append({"index": index, "error": error})
+                continue
+            merged.update(data)
+            accepted += 1
+            values += len(data)
+
+        result = {"accepted": accepted, "rejected": rejected, "values": values,
+                  "coalesced": values - len(merged), "atomic": atomic}
+        if atomic and rejected:
+            result.update(accepted=0, values=0, coalesced=0, error="Batch rejected; nothing was queued.")
+            return jsonify(result), 400
+        if not accepted:
+            result["error"] = "No valid updates in the batch."
+            return jsonify(result), 400
+
+        # One item for the whole batch: one wake-up and one pass through the scheduler
+        outgoing_data.append(merged)
+        return jsonify(result), 200
+
+    @app.route('/stream', methods=['GET'])
+    def stream_route():
+        """
+        Server-Sent Events: one "snapshot" event with the current values,
+        then one event per update holding only the keys that changed.
+        ?keys=a,b limits the stream to those keys.
+        """
+        keys = [key for key in request.args.get("keys", "").split(",") if key] or None
+        subscriber, initial = hub.subscribe(keys)
+
+        def events():
+            try:
+                yield f"event: snapshot\ndata: {compact_json(initial)}\n\n"
+                while True:
+                    changed = subscriber.get(timeout=15)
+                    if subscriber.dropped:
+                        yield "event: dropped\ndata: {}\n\n"
+                        return
+                    if subscriber.closed:
+                        return
+                    if not changed:
+                        # Keeps proxies from closing an idle stream and notices gone clients
+                        yield ": keepalive\n\n"
+                        continue
+                    yield f"data: {compact_json(changed)}\n\n"
+            finally:
+                hub.unsubscribe(subscriber)
+
+        return Response(events(), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    @app.route('/ws', methods=['GET'], websocket=True)
+    def websocket_route():
+        """
+        WebSocket carrying both directions on one connection. The server
+        sends {"type": "snapshot", "values": {...}} first and then one
+        {"type": "update", "values": {...}} frame per batch of changes;
+        ?keys=a,b filters them like /stream. Each message from the client is
+        a JSON object of key/value pairs and is handled exactly like a POST
+        to /; invalid ones are answered with {"type": "error", ...}.
+        """
+        ws = upgrade(request.environ)
+        if ws is None:
+            return not_a_websocket()
+        keys = [key for key in request.args.get("keys", "").split(",") if key] or None
+        subscriber, initial = hub.subscribe(keys)
+
+        def send_updates():
+            ws.send(compact_json({"type": "snapshot", "values": initial}))
+            while not ws.closed:
+                changed = subscriber.get(timeout=15)
+                if subscriber.dropped:
+                    ws.send('{"type":"dropped"}')
+                    ws.close(CLOSE_TRY_AGAIN, "Client fell behind")
+                elif subscriber.closed:
+                    ws.close(CLOSE_GOING_AWAY, "Server stopping")
+                elif not changed:
+                    ws.ping()
+                else:
+                    # Everything that changed since the last frame goes out together
+                    ws.send(compact_json({"type": "update", "values": changed}))
+
+        sender = threading.Thread(target=send_updates, name="WebSocket sender", daemon=True)
+        sender.start()
+        try:
+            while True:
+                message = ws.receive()
+                if message is None:
+                    break
+                try:
+                    data = json.loads(message)
+                except ValueError:
+                    data = None
+                error = validate_posted(data)
+                if error:
+                    ws.send(compact_json({"type": "error", "error": error}))
+                    continue
+                # Same path as a POST: the GUI wakes up and writes it right away
+                outgoing_data.append(data)
+        finally:
+            subscriber.close()
+            hub.unsubscribe(subscriber)
+            sender.join(1)
+        return UpgradedResponse()
+
+    @app.route('/ws', methods=['GET'], endpoint='websocket_expected')
+    def not_a_websocket():
+        # Plain requests don't match the websocket rule above
+        return jsonify({"error": "Expected a WebSocket upgrade request."}), 400
+
+    return app
+
+
+def run_flask_app(host, port, snapshot, outgoing_data, status_snapshot=None):
+    """Entry point of the separate server process."""
+    create_flask_app(snapshot, outgoing_data, status_snapshot).run(host=host, port=port, use_reloader=False)
+
+
+class InProcessServer:
+    """
+    Serves the same Flask app from a thread of the GUI process. There is no
+    second interpreter to start, the snapshot is read from this process's
+    own mapping, and stopping is a shutdown() instead of terminate().
+    """
+
+    def __init__(self, host, port, snapshot, outgoing_data, status_snapshot=None, poll_interval=0.02):
+        # Binds right away, so a port in use raises OSError here
+        self.app = create_flask_app(snapshot, outgoing_data, status_snapshot)
+        self.server = make_server(host, port, self.app, threaded=True)
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(poll_interval,),
+                                       name="HTTP server", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        # Stream handlers run on their own threads; end them with the server
+        self.app.extensions["update_hub"].close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join(2)
+
+    def is_alive(self):
+        return self.thread.is_alive()
 
 # --------------------------------------------------------------------
 # Custom Labels
@@ -216,16 +482,68 @@ class CodeCopyLabel(QLabel):
 # --------------------------------------------------------------------
 # Arduino Searcher Thread
 # --------------------------------------------------------------------
+# Substrings of port names that are never an Arduino (macOS/Windows system ports)
+NON_ARDUINO_PORT_NAMES = ("bluetooth", "debug-console", "wlan", "airpods")
+
+
+def is_candidate_port(port):
+    """Cheap check on list_ports metadata for ports that could be an Arduino."""
+    device = port.device.lower()
+    description = (port.description or "").lower()
+    return not any(name in device or name in description for name in NON_ARDUINO_PORT_NAMES)
+
+
+def port_identity(port):
+    """USB identity of a list_ports entry, as stored for the known-port cache."""
+    return {
+        "device": port.device,
+        "vid": port.vid,
+        "pid": port.pid,
+        "serial_number": port.serial_number,
+    }
+
+
+def match_known_port(ports, known):
+    """Find the cached board among ports, preferring its USB serial number over its device name."""
+    if not known:
+        return None
+    for port in ports:
+        if port.vid is None or (port.vid, port.pid) != (known.get("vid"), known.get("pid")):
+            continue
+        if known.get("serial_number"):
+            if port.serial_number == known["serial_number"]:
+                return port
+        elif port.device == known.get("device"):
+            return port
+    return None
+
+
 class ArduinoSearcher(QThread):
+    """
+    Finds the port an Arduino sketch is announcing itself on.
+
+    A port matching the last successful connection (same USB VID/PID and
+    serial number) is returned straight away without being probed; the
+    handshake confirms it. Otherwise every candidate port is probed at the
+    same time on a thread pool, USB ports first, and the first one to send
+    the identifier wins. With find_all=True every port that sends the
+    identifier is reported.
+    """
     found_port = pyqtSignal(str)
     no_port = pyqtSignal()
     progress = pyqtSignal(str)
 
-    def __init__(self, baud_rate, identifier, test_duration=5):
+    def __init__(self, baud_rate, identifier, test_duration=5, known_port=None, max_workers=16,
+                 find_all=False):
         super().__init__()
         self.baud_rate = baud_rate
         self.identifier = identifier
         self.test_duration = test_duration
+        self.known_port = known_port
+        self.max_workers = max_workers
+        self.find_all = find_all
+        self.from_cache = False
+        self._stop_event = threading.Event()
 
     def run(self):
         ports = list(serial.tools.list_ports.comports())
@@ -233,30 +551,324 @@ class ArduinoSearcher(QThread):
             self.no_port.emit()
             return
 
-        for port in ports:
-            self.progress.emit(f"Testing port: {port.device}")
-            try:
-                with serial.Serial(port.device, self.baud_rate, timeout=0.5) as ser_:
-                    start_time = time.time()
-                    end_time = start_time + self.test_duration
-                    while time.time() < end_time:
-                        if ser_.in_waiting:
-                            line = ser_.readline().decode('utf-8').strip()
-                            if line == self.identifier:
-                                self.found_port.emit(port.device)
-                                return
-                        else:
-                            time.sleep(0.1)
-            except serial.SerialException:
-                pass
+        known = match_known_port(ports, self.known_port)
+        if known:
+            self.from_cache = True
+            self.progress.emit(f"Found known Arduino on {known.device}")
+            self.found_port.emit(known.device)
+            return
+
+        candidates = [port for port in ports if is_candidate_port(port)]
+        usb_ports = [port for port in candidates if port.vid is not None]
+        for group in (usb_ports, [port for port in candidates if port.vid is None]):
+            if group and self.probe_ports(group):
+                return
         self.no_port.emit()
 
+    def probe_ports(self, ports):
+        devices = [port.device for port in ports]
+        self.progress.emit(f"Testing ports: {', '.join(devices)}")
+        workers = max(1, min(len(devices), self.max_workers))
+        found = False
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(self.probe_port, device): device for device in devices}
+            for future in as_completed(futures):
+                if future.result():
+                    found = True
+                    self.found_port.emit(futures[future])
+                    if not self.find_all:
+                        # Let the other probes notice and close their ports
+                        self._stop_event.set()
+                        break
+        return found
+
+    def probe_port(self, device):
+        """Listen on one port for the identifier line until it arrives or test_duration passes."""
+        try:
+            with serial.Serial(device, self.baud_rate, timeout=0.1) as ser_:
+                pending = b""
+                end_time = time.monotonic() + self.test_duration
+                while time.monotonic() < end_time and not self._stop_event.is_set():
+                    chunk = ser_.read(ser_.in_waiting or 1)
+                    if not chunk:
+                        continue
+                    lines = (pending + chunk).split(b"\n")
+                    pending = lines.pop()[-256:]
+                    for line in lines:
+                        if line.decode('utf-8', errors='replace').strip() == self.identifier:
+                            return True
+        except (serial.SerialException, OSError, ValueError):
+            pass
+        return False
+
+    def stop(self):
+        """Ask the running probes to give up."""
+        self._stop_event.set()
+
+# --------------------------------------------------------------------
+# Serial Reader Thread
+# --------------------------------------------------------------------
+class SerialReader(QThread):
+    """
+    Opens the serial port, runs the CONNECTED/NAME handshake and then reads
+    everything waiting on the port in one call. Parsed (key, value, timestamp)
+    tuples are handed to the UI as one batch per read, including data lines
+    that arrive before the board has sent its name.
+
+    With binary=True the reader also offers the binary protocol, watches for
+    the sketch's PROTOCOL:BIN1 answer and hands every byte after it to a
+    BinaryDecoder instead.
+
+    With a capture (a CaptureWriter) every byte read and written is recorded.
+    connection_factory replaces serial.Serial, e.g. with a ReplaySerial.
+    """
+    connection_opened = pyqtSignal(object)
+    open_failed = pyqtSignal(str)
+    name_received = pyqtSignal(str)
+    handshake_complete = pyqtSignal(dict)
+    data_received = pyqtSignal(list)
+    read_error = pyqtSignal(str)
+
+    def __init__(self, port, baud_rate, binary=False, name_timeout=5, poll_interval=0.1,
+                 capture=None, connection_factory=None, parent=None):
+        super().__init__(parent)
+        self.port = port
+        self.baud_rate = baud_rate
+        self.binary = binary
+        self.poll_interval = poll_interval
+        self.capture = capture
+        self.connection_factory = connection_factory or serial.Serial
+        self.connection = None
+        self.handshake = Handshake(name_timeout=name_timeout)
+        self.parser = KeyValueParser(control_keys=("name", "protocol"))
+        if binary:
+            self.parser.halt_keys = frozenset({"protocol"})
+        self.decoder = None
+        self.protocol = "text"
+        self._running = False
+
+    def run(self):
+        self._running = True
+        handshake = self.handshake
+        handshake.start(time.monotonic())
+
+        try:
+            self.connection = self.connection_factory(self.port, self.baud_rate, timeout=self.poll_interval)
+            if self.capture:
+                self.connection = CapturedConnection(self.connection, self.capture)
+            handshake.opened(time.monotonic())
+            self.connection_opened.emit(self.connection)
+
+            self.connection.write(b"CONNECTED\n")
+            if self.binary:
+                # Older sketches ignore this and keep talking text
+                self.connection.write(PROTOCOL_REQUEST)
+            handshake.connected_sent(time.monotonic())
+        except (serial.SerialException, OSError, ValueError) as e:
+            handshake.fail(str(e), time.monotonic())
+            self.open_failed.emit(str(e))
+            return
+
+        while self._running:
+            try:
+                # Block for the first byte, then drain the rest of the buffer at once
+                chunk = self.connection.read(self.connection.in_waiting or 1)
+            except (serial.SerialException, OSError, TypeError) as e:
+                if self._running:
+                    self.read_error.emit(str(e))
+                return
+
+            now = time.monotonic()
+            if not chunk:
+                if handshake.poll(now):
+                    logging.warning("Arduino did not send its name; streaming without it.")
+                    self.handshake_complete.emit(handshake.metrics)
+                continue
+
+            now_ts = time.time()
+            if self.decoder:
+                batch = self.decoder.feed(chunk, now_ts)
+            else:
+                batch, controls = self.parser.feed(chunk, now_ts)
+                for key, value in controls:
+                    if key == "name":
+                        self.on_name(value, now)
+                    elif self.binary and key == "protocol" and value == PROTOCOL_NAME:
+                        self.switch_to_binary(batch, now_ts)
+
+            if not handshake.is_complete:
+                handshake.data_received(now, len(batch))
+                if handshake.poll(now):
+                    self.handshake_complete.emit(handshake.metrics)
+
+            if batch:
+                self.data_received.emit(batch)
+
+    def on_name(self, name, now):
+        self.name_received.emit(name)
+        if self.handshake.name_received(name, now):
+            self.handshake_complete.emit(self.handshake.metrics)
+
+    def switch_to_binary(self, batch, now_ts):
+        """Decode everything after the protocol answer as binary packets."""
+        self.decoder = BinaryDecoder()
+        self.protocol = "binary"
+        logging.info("Arduino accepted the binary protocol.")
+        batch.extend(self.decoder.feed(self.parser.detach(), now_ts))
+
+    def stop(self):
+        """Stop the read loop and wait for the thread to finish."""
+        self._running = False
+        try:
+            self.connection.cancel_read()
+        except (AttributeError, serial.SerialException, OSError):
+            pass
+        self.wait(2000)
+        if self.connection and self.connection.is_open:
+            self.connection.close()
+
+class OutgoingListener(QThread):
+    """
+    Blocks on the outgoing channel and hands everything posted to the UI
+    thread as soon as it arrives, as one list of (posted_at, data) per wake-up.
+    """
+    posted = pyqtSignal(list)
+
+    def __init__(self, channel, parent=None):
+        super().__init__(parent)
+        self.channel = channel
+        self._running = False
+
+    def run(self):
+        self._running = True
+        while self._running:
+            try:
+                items = self.channel.receive(timeout=1.0)
+            except (EOFError, OSError) as e:
+                if self._running:
+                    logging.error(f"Outgoing channel closed: {e}")
+                return
+            if items and self._running:
+                self.posted.emit(items)
+
+    def stop(self):
+        self._running = False
+        self.channel.wake()
+        self.wait(2000)
+
+# --------------------------------------------------------------------
+# Device Sessions
+# --------------------------------------------------------------------
+RECONNECT_INITIAL_DELAY = 0.05  # seconds
+RECONNECT_MAX_DELAY = 5.0
+
+
+class DeviceSession:
+    """
+    One connected board: its port, reader thread and place in the merged data
+    store. In multi-device mode every key the board sends is stored under
+    "<device_id>/<key>", and posted keys with that prefix are sent to it.
+
+    A session outlives its reader: when the board drops off the bus the
+    reader is stopped and replaced while the session, and everything the
+    app keeps for its keys, stays in place.
+    """
+
+    def __init__(self, port, from_cache=False):
+        self.port = port
+        self.from_cache = from_cache
+        self.identity = None
+        self.reader = None
+        self.connection = None
+        self.name = None
+        self.device_id = None
+        self.prefix = ""
+        self.handshake_metrics = {}
+        self.early_batches = []
+        self.capture = None
+        self._qualified_keys = {}
+
+        self.reconnecting = False
+        self.reconnect_delay = RECONNECT_INITIAL_DELAY
+        self.reconnect_attempts = 0
+        self.outages = 0
+        self.outage_started = None
+        self.reconnect_latencies_ms = deque(maxlen=100)
+
+    @property
+    def is_open(self):
+        return self.connection is not None and self.connection.is_open
+
+    def qualify(self, batch):
+        """Prefix every key in a batch with this device's id."""
+        if not self.prefix:
+            return batch
+        qualified_keys = self._qualified_keys
+        qualified = []
+        for key, value, now_ts in batch:
+            qualified_key = qualified_keys.get(key)
+            if qualified_key is None:
+                qualified_key = qualified_keys[key] = self.prefix + key
+            qualified.append((qualified_key, value, now_ts))
+        return qualified
+
+    def write(self, data):
+        self.connection.write(data)
+
+    @property
+    def reconnect_stats(self):
+        latencies = self.reconnect_latencies_ms
+        return {
+            "outages": self.outages,
+            "reconnecting": self.reconnecting,
+            "last_reconnect_ms": latencies[-1] if latencies else None,
+            "avg_reconnect_ms": round(sum(latencies) / len(latencies), 1) if latencies else None,
+            "max_reconnect_ms": max(latencies) if latencies else None,
+        }
+
+    def begin_outage(self):
+        self.close()
+        self.reconnecting = True
+        self.outages += 1
+        self.outage_started = time.monotonic()
+        self.reconnect_delay = RECONNECT_INITIAL_DELAY
+        self.reconnect_attempts = 0
+
+    def end_outage(self):
+        """Mark the board as back and return how long it was gone, in ms."""
+        latency_ms = round((time.monotonic() - self.outage_started) * 1000, 1)
+        self.reconnect_latencies_ms.append(latency_ms)
+        self.reconnecting = False
+        return latency_ms
+
+    def next_reconnect_delay(self):
+        """Exponential backoff between reconnect attempts, in seconds."""
+        delay = self.reconnect_delay
+        self.reconnect_delay = min(delay * 2, RECONNECT_MAX_DELAY)
+        self.reconnect_attempts += 1
+        return delay
+
+    def close(self):
+        """Stop the reader thread, which also closes the serial connection."""
+        if self.reader:
+            for signal in (self.reader.connection_opened, self.reader.open_failed,
+                           self.reader.name_received, self.reader.handshake_complete,
+                           self.reader.data_received, self.reader.read_error):
+                signal.disconnect()
+            self.reader.stop()
+            self.reader = None
+        self.connection = None
+
 # --------------------------------------------------------------------
 # Main ArduinoApp
 # --------------------------------------------------------------------
 class ArduinoApp(QMainWindow):
     def __init__(self, arduino_data, outgoing_data,
-                 baud_rate=9600, identifier="ARDUINO_READY"):
+                 baud_rate=9600, identifier="ARDUINO_READY", binary_protocol=False,
+                 multi_device=False, auto_reconnect=True, capture_dir=None,
+                 replay_path=None, replay_speed=1.0, server_mode="process",
+                 history_capacity=DEFAULT_CAPACITY, history_max_age=None, staleness_rules=None,
+                 filter_rules=None, derived_channels=None):
         super().__init__()
 
         # (1) Detect system dark/light mode
@@ -290,26 +902,55 @@ class ArduinoApp(QMainWindow):
         self.outgoing_data = outgoing_data
         self.baud_rate = baud_rate
         self.identifier = identifier
+        self.binary_protocol = binary_protocol
+        self.multi_device = multi_device
+        self.auto_reconnect = auto_reconnect
+        self.capture_dir = capture_dir
+        self.replay_path = replay_path
+        self.replay_speed = replay_speed
+        self.server_mode = server_mode
 
-        self.arduino = None
-        self.port = None
-        self.arduino_name = None
+        self.sessions = {}  # port -> DeviceSession
+        self.devices = {}   # device id -> DeviceSession (multi-device mode)
 
         self.data = {}
         self.server_process = None
+        self.in_process_server = None
         self.is_server_running = False
 
         self.sent_data = {}
         self.received_data = {}
-        self.sent_attempt_times_buffer = {}
-        self.received_update_times_buffer = {}
-
-        self.sent_baseline_averages = {}
-        self.received_baseline_averages = {}
+        # key -> IntervalStats of the time between posts / readings
+        self.sent_interval_stats = {}
+        self.received_interval_stats = {}
+        self.baseline_min_samples = 20
         self.last_sent_values = {}
+        # Inferred type per key
+        self.received_types = ChannelTypes()
+        self.sent_types = ChannelTypes()
+        # Which readings are a change to publish, by filter_rules
+        self.received_filter = ChangeFilter()
+        self.apply_filter_rules(filter_rules or {})
+        # Channels computed from received ones, published with them
+        self.derived_channels = derived_channels or DerivedChannels()
+        self.shadowed_keys = set()  # received keys named like a derived channel
+
+        # Every reading and every value written, per key, within the retention
+        self.received_history = TimeSeriesStore(history_capacity, history_max_age)
+        self.sent_history = TimeSeriesStore(history_capacity, history_max_age)
 
         self.threshold_percentage = 0.10
 
+        # Which channels went quiet, by the default rule the table always used
+        # (relative=threshold_percentage) unless staleness_rules say otherwise
+        self.received_staleness = StalenessEngine(relative=self.threshold_percentage,
+                                                  min_samples=self.baseline_min_samples)
+        self.sent_staleness = StalenessEngine(relative=self.threshold_percentage,
+                                              min_samples=self.baseline_min_samples)
+        self.apply_staleness_rules(staleness_rules or {})
+        # The stale received channels, for GET /stale
+        self.staleness_status = SnapshotStore()
+
         
         self.setGeometry(100, 100, 800, 600)
         self.stacked_widget = QStackedWidget(self)
@@ -329,9 +970,31 @@ class ArduinoApp(QMainWindow):
         self.age_timer.timeout.connect(self.update_table)
         self.age_timer.start(1000)
 
+        self.staleness_timer = QTimer()
+        self.staleness_timer.timeout.connect(self.check_staleness)
+        self.staleness_timer.start(250)
+
+        # Publishes changes the filter held back for their min_interval
+        self.release_timer = QTimer()
+        self.release_timer.setSingleShot(True)
+        self.release_timer.timeout.connect(self.release_held)
+
+        # Posts are written as soon as they arrive; the timer only retries
+        # values that had to wait for link budget
+        self.write_scheduler = WriteScheduler(self.baud_rate, burst_interval=0.5)
+        self.outgoing_latency = LatencyHistogram()
         self.outgoing_timer = QTimer()
-        self.outgoing_timer.timeout.connect(self.process_outgoing_data)
-        self.outgoing_timer.start(500)
+        self.outgoing_timer.setInterval(20)
+        self.outgoing_timer.timeout.connect(self.flush_backlog)
+        self.outgoing_listener = OutgoingListener(self.outgoing_data)
+        self.outgoing_listener.posted.connect(self.process_outgoing_data)
+        self.outgoing_listener.start()
+
+        # Outgoing writes refresh the table at most this often
+        self.table_refresh_timer = QTimer()
+        self.table_refresh_timer.setSingleShot(True)
+        self.table_refresh_timer.setInterval(100)
+        self.table_refresh_timer.timeout.connect(self.update_table)
 
         
     # ----------------------------------------------------------------
@@ -605,9 +1268,14 @@ class ArduinoApp(QMainWindow):
 
     def start_search(self):
         self.reset_connection()
+        if self.replay_path:
+            self.connect_to_arduino(self.replay_path)
+            return
         self.stacked_widget.setCurrentWidget(self.searching_screen_widget)
         self.current_line_label.setText("")  # Clear the progress label
-        self.searcher = ArduinoSearcher(self.baud_rate, self.identifier, test_duration=5)
+        known_port = None if self.multi_device else self.load_known_port()
+        self.searcher = ArduinoSearcher(self.baud_rate, self.identifier, test_duration=5,
+                                        known_port=known_port, find_all=self.multi_device)
         self.searcher.found_port.connect(self.on_port_found)
         self.searcher.no_port.connect(self.on_no_port)
         self.searcher.progress.connect(self.on_search_progress)
@@ -619,6 +1287,7 @@ class ArduinoApp(QMainWindow):
             self.searcher.found_port.disconnect(self.on_port_found)
             self.searcher.no_port.disconnect(self.on_no_port)
             self.searcher.progress.disconnect(self.on_search_progress)
+            self.searcher.stop()
             self.searcher.quit()
             self.searcher.wait(500)
             if self.searcher.isRunning():
@@ -637,67 +1306,269 @@ class ArduinoApp(QMainWindow):
         QApplication.processEvents()
 
     def on_port_found(self, port):
-        self.port = port
-        if self.searcher and self.searcher.isRunning():
+        from_cache = self.searcher.from_cache if self.searcher else False
+        if not self.multi_device and self.searcher and self.searcher.isRunning():
             self.searcher.quit()
             self.searcher.wait()
             self.searcher = None
-        self.connect_to_arduino()
+        self.connect_to_arduino(port, from_cache=from_cache)
+
+    def load_known_port(self):
+        """The USB identity of the last board that completed a handshake, if any."""
+        settings = QSettings("ArduinoReader", "ArduinoReader")
+        if not settings.contains("known_port/vid"):
+            return None
+        return {
+            "device": settings.value("known_port/device", "", type=str),
+            "vid": settings.value("known_port/vid", type=int),
+            "pid": settings.value("known_port/pid", type=int),
+            "serial_number": settings.value("known_port/serial_number", "", type=str) or None,
+        }
+
+    def save_known_port(self, device):
+        for port in serial.tools.list_ports.comports():
+            if port.device == device and port.vid is not None:
+                settings = QSettings("ArduinoReader", "ArduinoReader")
+                for field, value in port_identity(port).items():
+                    settings.setValue(f"known_port/{field}", value if value is not None else "")
+                return
+
+    def forget_known_port(self):
+        QSettings("ArduinoReader", "ArduinoReader").remove("known_port")
 
     def on_no_port(self):
         self.current_line_label.setText("No ports found.")
         QTimer.singleShot(2000, self.start_search)
 
-    def connect_to_arduino(self):
-        global ser
-        try:
-            self.arduino = serial.Serial(self.port, self.baud_rate, timeout=1)
-            ser = self.arduino
-            self.stacked_widget.setCurrentWidget(self.dashboard_widget)
-            self.show_port_ui()
-            self.arduino.write(b"CONNECTED\n")
-            QTimer.singleShot(500, self.read_arduino_name)
+    def connect_to_arduino(self, port, from_cache=False):
+        """Open a port and run the handshake on its own background reader thread."""
+        if port in self.sessions:
+            return
+        if not self.sessions:
             self.last_sent_values.clear()
-        except serial.SerialException as e:
-            self.search_label.setText(f"Error: {e}")
-            QTimer.singleShot(2000, self.start_search)
+
+        session = DeviceSession(port, from_cache=from_cache)
+        self.sessions[port] = session
+        self.start_session_reader(session)
+        logging.info(f"Connecting to {port}.")
+
+    def start_session_reader(self, session):
+        connection_factory = None
+        if self.replay_path:
+            connection_factory = partial(ReplaySerial, speed=self.replay_speed)
+        elif self.capture_dir and session.capture is None:
+            session.capture = self.open_capture(session.port)
+        reader = SerialReader(session.port, self.baud_rate, binary=self.binary_protocol,
+                              capture=session.capture, connection_factory=connection_factory)
+        reader.connection_opened.connect(partial(self.on_connection_opened, session))
+        reader.open_failed.connect(partial(self.on_open_failed, session))
+        reader.name_received.connect(partial(self.on_name_received, session))
+        reader.handshake_complete.connect(partial(self.on_handshake_complete, session))
+        reader.data_received.connect(partial(self.on_device_data, session))
+        reader.read_error.connect(partial(self.on_device_error, session))
+        session.reader = reader
+        reader.start()
+
+    def open_capture(self, port):
+        """Start a capture file for one session; it lasts across reconnects."""
+        os.makedirs(self.capture_dir, exist_ok=True)
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.path.basename(port)}.cap"
+        capture = CaptureWriter(os.path.join(self.capture_dir, name), self.baud_rate)
+        logging.info(f"Recording {port} to {capture.path}.")
+        return capture
+
+    def close_session(self, session):
+        session.close()
+        if session.capture:
+            session.capture.close()
+            logging.info(f"Recorded {session.capture.bytes} bytes in {session.capture.chunks} chunks "
+                         f"to {session.capture.path}.")
+            session.capture = None
+        self.write_scheduler.forget(session)
+        self.sessions.pop(session.port, None)
+        if self.devices.get(session.device_id) is session:
+            del self.devices[session.device_id]
+        logging.info(f"Closed connection to {session.port}.")
+
+    def close_sessions(self):
+        for session in list(self.sessions.values()):
+            self.close_session(session)
+
+    def is_current(self, session):
+        """False for sessions that were closed while their signals were still queued."""
+        return self.sessions.get(session.port) is session
+
+    def on_connection_opened(self, session, connection):
+        if not self.is_current(session):
+            return
+        session.connection = connection
+        if session.reconnecting:
+            latency_ms = session.end_outage()
+            self.update_name_label()
+            logging.info(f"Reconnected to {session.port} after {latency_ms} ms "
+                         f"(outage {session.outages}, {session.reconnect_attempts} attempts).")
+            return
+        if session.identity is None:
+            session.identity = self.lookup_port_identity(session.port)
+        self.stacked_widget.setCurrentWidget(self.dashboard_widget)
+        self.show_port_ui()
         self.setWindowTitle("Dashboard")
 
-    def read_arduino_name(self):
-        """Read the Arduino name and transition to data reading."""
-        if not self.arduino or not self.arduino.is_open:
-            logging.error("Cannot read Arduino name: Serial connection is not open.")
+    def on_open_failed(self, session, message):
+        if not self.is_current(session):
             return
+        if session.reconnecting:
+            session.close()
+            self.schedule_reconnect(session)
+            return
+        self.close_session(session)
+        if session.from_cache:
+            self.forget_known_port()
+        logging.error(f"Could not open {session.port}: {message}")
+        if not self.sessions:
+            self.search_label.setText(f"Error: {message}")
+            QTimer.singleShot(2000, self.start_search)
 
-        timeout = 5  # Timeout for reading name
-        start_time = time.time()
+    def on_name_received(self, session, name):
+        if not self.is_current(session):
+            return
+        session.name = name
+        self.update_name_label()
+        logging.info(f"Arduino name updated: {name} ({session.port})")
+
+    def update_name_label(self):
+        names = []
+        for session in self.sessions.values():
+            name = session.name or os.path.basename(session.port)
+            names.append(f"{name} (reconnecting)" if session.reconnecting else name)
+        if not names:
+            self.name_label.setText("Arduino: Not Connected")
+        elif self.multi_device:
+            self.name_label.setText(f"Arduinos: {', '.join(names)}")
+        else:
+            self.name_label.setText(f"Arduino: {names[0]}")
 
-        while time.time() - start_time < timeout:
-            if self.arduino.in_waiting:
-                try:
-                    # Read line from the serial buffer
-                    line = self.arduino.readline().decode('utf-8').strip()
-                    logging.debug(f"Received from Arduino: {line}")
-
-                    # Check if the line contains the name
-                    if line.startswith("NAME:"):
-                        self.arduino_name = line[5:].strip()
-                        self.name_label.setText(f"Arduino: {self.arduino_name}")
-                        logging.info(f"Arduino name updated: {self.arduino_name}")
-                        break  # Exit the name-reading loop
-                except Exception as e:
-                    logging.error(f"Error reading Arduino name: {e}")
-
-        # Transition to data reading
-        QTimer.singleShot(100, self.read_data)  # Start reading data
+    def on_handshake_complete(self, session, metrics):
+        if not self.is_current(session):
+            return
+        session.handshake_metrics = metrics
+        logging.info(f"Handshake finished on {session.port}: {metrics}")
+
+        if self.multi_device:
+            if session.device_id is None:
+                self.assign_device_id(session)
+        elif metrics["first_byte_ms"] is not None:
+            self.save_known_port(session.port)
+        elif session.from_cache:
+            # The cached board went silent; search properly instead
+            logging.warning(f"No data from cached port {session.port}; searching all ports.")
+            self.forget_known_port()
+            self.handle_disconnect()
+            self.start_search()
+
+    def assign_device_id(self, session):
+        """Pick the key prefix for a board and release the data it sent before its name."""
+        base_id = (session.name or os.path.basename(session.port)).replace("/", "_")
+        device_id = base_id
+        suffix = 2
+        while device_id in self.devices:
+            device_id = f"{base_id}_{suffix}"
+            suffix += 1
+
+        session.device_id = device_id
+        session.prefix = f"{device_id}/"
+        self.devices[device_id] = session
+        logging.info(f"Device {session.port} publishes as '{device_id}/'.")
+
+        early_batches, session.early_batches = session.early_batches, []
+        for batch in early_batches:
+            self.read_data(session.qualify(batch))
+
+    def on_device_data(self, session, batch):
+        if not self.is_current(session):
+            return
+        if self.multi_device and session.device_id is None:
+            # Hold data until the handshake tells us which prefix to use
+            session.early_batches.append(batch)
+            return
+        self.read_data(session.qualify(batch))
+
+    def on_device_error(self, session, message):
+        if not self.is_current(session):
+            return
+        logging.error(f"Serial error on {session.port}: {message}")
+        if session.reconnecting:
+            return
+        if self.auto_reconnect and session.connection is not None:
+            self.begin_reconnect(session)
+        elif len(self.sessions) > 1:
+            self.close_session(session)
+            self.update_name_label()
+        else:
+            self.handle_disconnect()
+
+    # ----------------------------------------------------------------
+    # Reconnecting
+    # ----------------------------------------------------------------
+    def lookup_port_identity(self, device):
+        for port in serial.tools.list_ports.comports():
+            if port.device == device:
+                return port_identity(port)
+        return None
+
+    def begin_reconnect(self, session):
+        """Keep the session, its data and the server; retry the board with backoff."""
+        session.begin_outage()
+        self.update_name_label()
+        logging.warning(f"Lost {session.port}; reconnecting (outage {session.outages}).")
+        self.schedule_reconnect(session)
+
+    def schedule_reconnect(self, session):
+        QTimer.singleShot(int(session.next_reconnect_delay() * 1000),
+                          partial(self.try_reconnect, session))
+
+    def try_reconnect(self, session):
+        if not self.is_current(session) or not session.reconnecting:
+            return
+
+        port = self.find_reconnect_port(session)
+        if port is None:
+            logging.debug(f"Board from {session.port} not present yet.")
+            self.schedule_reconnect(session)
+            return
+
+        if port != session.port:
+            logging.info(f"Board from {session.port} reappeared on {port}.")
+            del self.sessions[session.port]
+            session.port = port
+            self.sessions[port] = session
+        self.start_session_reader(session)
+
+    def find_reconnect_port(self, session):
+        """
+        The port to retry: the same one while it exists, otherwise wherever
+        a port with the same USB serial number shows up.
+        """
+        identity = session.identity
+        if not identity or not identity.get("serial_number"):
+            return session.port
+        ports = list(serial.tools.list_ports.comports())
+        if any(port.device == session.port for port in ports):
+            return session.port
+        match = match_known_port(ports, identity)
+        return match.device if match else None
+
+    def reconnect_stats(self):
+        """Outage counts and reconnect latencies per connected port."""
+        return {session.port: session.reconnect_stats for session in self.sessions.values()}
 
     def handle_disconnect(self):
         if self.is_server_running:
             logging.info("Stopping server before disconnecting Arduino.")
             self.stop_server()
 
-        if self.arduino and self.arduino.is_open:
-            self.arduino.close()
+        if self.sessions:
+            self.close_sessions()
             logging.info("Arduino disconnected.")
 
         self.reset_connection()
@@ -711,27 +1582,42 @@ class ArduinoApp(QMainWindow):
         self.data.clear()
         self.sent_data.clear()
         self.received_data.clear()
-        self.sent_attempt_times_buffer.clear()
-        self.received_update_times_buffer.clear()
-        self.sent_baseline_averages.clear()
-        self.received_baseline_averages.clear()
+        self.sent_interval_stats.clear()
+        self.received_interval_stats.clear()
         self.last_sent_values.clear()
+        self.received_history.clear()
+        self.sent_history.clear()
+        self.received_staleness.clear()
+        self.sent_staleness.clear()
+        self.staleness_status.clear()
+        self.received_types.clear()
+        self.sent_types.clear()
+        self.received_filter.clear()
+        self.release_timer.stop()
+        self.derived_channels.clear()
         self.data_table.setRowCount(0)
 
         self.arduino_data.clear()
         logging.info("All data and buffers cleared.")
 
     def reset_connection(self):
-        self.port = None
-        self.arduino = None
+        self.close_sessions()
         self.data.clear()
         self.sent_data.clear()
         self.received_data.clear()
-        self.sent_attempt_times_buffer.clear()
-        self.received_update_times_buffer.clear()
-        self.sent_baseline_averages.clear()
-        self.received_baseline_averages.clear()
+        self.sent_interval_stats.clear()
+        self.received_interval_stats.clear()
         self.last_sent_values.clear()
+        self.received_history.clear()
+        self.sent_history.clear()
+        self.received_staleness.clear()
+        self.sent_staleness.clear()
+        self.staleness_status.clear()
+        self.received_types.clear()
+        self.sent_types.clear()
+        self.received_filter.clear()
+        self.release_timer.stop()
+        self.derived_channels.clear()
 
         self.arduino_data.clear()
         logging.info("Connection & buffers reset.")
@@ -777,9 +1663,26 @@ class ArduinoApp(QMainWindow):
         self.server_button.setStyleSheet(self.styles_dict["button_style_inactive"])
         self.server_button.setEnabled(False)
 
+        if self.server_mode == "thread":
+            try:
+                self.in_process_server = InProcessServer(
+                    '0.0.0.0', port, self.arduino_data.snapshot, self.outgoing_data,
+                    self.staleness_status.snapshot)
+            except OSError as e:
+                QMessageBox.warning(self, "Port in Use", f"Port {port} is in use.")
+                logging.warning(f"Could not start server on port {port}: {e}")
+                self.update_server_stopped()
+                return
+            self.in_process_server.start()
+            self.is_server_running = True
+            self.update_server_started(port)
+            logging.info(f"Started in-process Flask server on port {port}.")
+            return
+
         self.server_process = multiprocessing.Process(
             target=run_flask_app,
-            args=('0.0.0.0', port, self.arduino_data, self.outgoing_data)
+            args=('0.0.0.0', port, self.arduino_data.snapshot, self.outgoing_data,
+                  self.staleness_status.snapshot)
         )
         self.server_process.start()
         self.is_server_running = True
@@ -802,6 +1705,12 @@ class ArduinoApp(QMainWindow):
         self.server_button.setText("Stopping Server...")
         self.server_button.setStyleSheet(self.styles_dict["button_style_inactive"])
         self.server_button.setEnabled(False)
+        if self.in_process_server:
+            self.in_process_server.stop()
+            self.in_process_server = None
+            self.is_server_running = False
+            self.update_server_stopped()
+            return
         if self.is_server_running and self.server_process_running():
             self.server_process.terminate()
             self.server_process.join()
@@ -824,61 +1733,166 @@ class ArduinoApp(QMainWindow):
         return self.server_process and self.server_process.is_alive()
 
     # ----------------------------------------------------------------
-    # Baseline Calculation
+    # Change filters and staleness
     # ----------------------------------------------------------------
-    def calculate_baseline(self, buffer, min_samples=20):
-        if len(buffer) < min_samples:
-            logging.debug(f"Not enough samples for baseline: {len(buffer)}/{min_samples}.")
-            return None
-
-        intervals = [buffer[i] - buffer[i - 1] for i in range(1, len(buffer))]
-        if not intervals:
-            return None
-
-        avg_interval_ms = int(sum(intervals) / len(intervals) * 1000)
-        logging.debug(f"Baseline: {avg_interval_ms} ms from {len(buffer)} timestamps.")
-        return avg_interval_ms
+    def checked_rules(self, rules, fields, kind):
+        """
+        rules ({key: {field: number or null}}) without the entries that name a
+        field not in fields or set one to something else; each is logged and skipped.
+        """
+        checked = {}
+        for key, rule in rules.items():
+            if not isinstance(rule, dict):
+                logging.error(f"Ignoring the {kind} rule for '{key}': expected an object, got {rule!r}.")
+                continue
+            unknown = [field for field in rule if field not in fields]
+            if unknown:
+                logging.error(f"Ignoring the {kind} rule for '{key}': unknown field {', '.join(map(repr, unknown))} "
+                              f"(expected {', '.join(fields)}).")
+                continue
+            invalid = [field for field, value in rule.items()
+                       if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float)))]
+            if invalid:
+                logging.error(f"Ignoring the {kind} rule for '{key}': {', '.join(map(repr, invalid))} must be a number or null.")
+                continue
+            checked[key] = rule
+        return checked
+
+    def apply_filter_rules(self, rules):
+        """
+        rules maps a key, or "*" for every key without its own entry, to
+        {"deadband": x, "deadband_percent": p, "min_interval": s}.
+        """
+        rules = self.checked_rules(rules, ("deadband", "deadband_percent", "min_interval"), "filter")
+        default = rules.get("*", {})
+        self.received_filter.default_rules = tuple(
+            default.get(name, value) or 0.0 for name, value in
+            zip(("deadband", "deadband_percent", "min_interval"), self.received_filter.default_rules))
+        for key, rule in rules.items():
+            if key != "*":
+                self.received_filter.configure(key, **rule)
+
+    def apply_staleness_rules(self, rules):
+        """
+        rules maps a key, or "*" for every key without its own entry, to
+        {"timeout": s, "relative": fraction, "rate_floor": per second};
+        a rule set to null is turned off. They apply to received and sent keys.
+        """
+        rules = self.checked_rules(rules, ("timeout", "relative", "rate_floor"), "staleness")
+        for engine in (self.received_staleness, self.sent_staleness):
+            default = rules.get("*", {})
+            engine.default_rules = tuple(default.get(name, value) for name, value in
+                                         zip(("timeout", "relative", "rate_floor"), engine.default_rules))
+            for key, rule in rules.items():
+                if key != "*":
+                    engine.configure(key, **rule)
+
+    def check_staleness(self):
+        """Evaluate every channel's rules and report the ones that changed state."""
+        now = time.time()
+        changed = self.received_staleness.evaluate(now)
+        sent_changed = self.sent_staleness.evaluate(now)
+        if changed:
+            went_stale = {}
+            recovered = []
+            for key, stale, reason in changed:
+                if stale:
+                    went_stale[key] = {"reason": reason, "since": now}
+                    logging.warning(f"'{key}' is stale ({reason}).")
+                else:
+                    recovered.append(key)
+                    logging.info(f"'{key}' is receiving again.")
+            if recovered:
+                self.staleness_status.remove(recovered)
+            if went_stale:
+                self.staleness_status.update(went_stale)
+        if changed or sent_changed:
+            self.request_table_update()
 
     # ----------------------------------------------------------------
     # Reading from Arduino
     # ----------------------------------------------------------------
-    def read_data(self):
-        if not self.arduino or not self.arduino.is_open:
+    def read_data(self, batch):
+        """Apply a batch of (key, value, timestamp) readings from a serial reader."""
+        if not self.sessions:
             return
 
-        try:
-            while self.arduino.in_waiting:
-                line = self.arduino.readline().decode('utf-8').strip()
-                if ":" in line:
-                    key, value = line.split(":", 1)
-                    key, value = key.strip(), value.strip()
-
-                    if key.lower() == "name":
-                        continue
-
-                    now_ts = time.time()
-                    buf = self.received_update_times_buffer.setdefault(key, deque(maxlen=50))
-                    buf.append(now_ts)
-
-                    old_val = self.data.get(key)
-                    if old_val != value:
-                        self.data[key] = value
-                        self.arduino_data[key] = value
-                        self.received_data[key] = {'value': value, 'timestamp': now_ts}
-                        logging.info(f"'{key}' changed => {value}")
-                    else:
-                        self.received_data[key] = {'value': value, 'timestamp': now_ts}
-                        logging.debug(f"'{key}' unchanged. Timestamp appended.")
-
-                    new_baseline = self.calculate_baseline(buf, min_samples=20)
-                    if new_baseline:
-                        self.received_baseline_averages[key] = new_baseline
-
-        except (serial.SerialException, OSError, Exception) as e:
-            logging.error(f"Exception in read_data: {e}")
-            self.handle_disconnect()
-
-        QTimer.singleShot(100, self.read_data)
+        changed = {}
+        history = self.received_history
+        interval_stats = self.received_interval_stats
+        staleness = self.received_staleness
+        types = self.received_types
+        change_filter = self.received_filter
+        derived = self.derived_channels
+        derived_inputs = derived.watch
+        derived_names = derived.channels
+        for key, value, now_ts in batch:
+            if key in derived_names:
+                # The derived channel of that name wins; mixing them would
+                # overwrite each other's value
+                if key not in self.shadowed_keys:
+                    self.shadowed_keys.add(key)
+                    logging.warning(f"Ignoring readings of '{key}': a derived channel has that name.")
+                continue
+            stats = interval_stats.get(key)
+            if stats is None:
+                stats = interval_stats[key] = IntervalStats()
+            stats.record(now_ts)
+            staleness.seen(key, stats)
+            value = types.coerce(key, value)
+            # History keeps every reading; only changes are published
+            history.append(key, value, now_ts)
+            if key in derived_inputs:
+                derived.feed(key, value)
+
+            if change_filter.offer(key, value, now_ts):
+                self.data[key] = value
+                changed[key] = value
+                self.received_data[key] = {'value': value, 'timestamp': now_ts}
+                logging.info(f"'{key}' changed => {value}")
+            else:
+                # The shown value stays, with the new timestamp
+                self.received_data[key] = {'value': change_filter.value(key), 'timestamp': now_ts}
+                logging.debug(f"'{key}' unchanged. Timestamp appended.")
+
+        if batch and derived.dirty:
+            # Once per batch, with the timestamp of its last reading
+            for key, value in derived.recompute():
+                value = types.coerce(key, value)
+                history.append(key, value, now_ts)
+                # Not logged: they change with their inputs, which are
+                if change_filter.offer(key, value, now_ts):
+                    self.data[key] = value
+                    changed[key] = value
+
+        if changed:
+            # One snapshot publish per batch instead of one per key
+            self.arduino_data.update(changed)
+        if change_filter.held:
+            self.schedule_release()
+
+    def schedule_release(self):
+        """Arm the release timer for the earliest held change, unless it is already due sooner."""
+        delay = max(0, int((self.received_filter.next_release() - time.time()) * 1000) + 1)
+        timer = self.release_timer
+        if not timer.isActive() or delay < timer.remainingTime():
+            timer.start(delay)
+
+    def release_held(self):
+        """Publish the changes whose min_interval is over."""
+        released = self.received_filter.release(time.time())
+        if released:
+            changed = {}
+            for key, value, _ in released:
+                self.data[key] = value
+                changed[key] = value
+                if key in self.received_data:
+                    self.received_data[key] = {'value': value, 'timestamp': self.received_data[key]['timestamp']}
+                logging.info(f"'{key}' changed => {value}")
+            self.arduino_data.update(changed)
+            self.request_table_update()
+        if self.received_filter.held:
+            self.schedule_release()
 
     # ----------------------------------------------------------------
     # Updating the Table
@@ -897,36 +1911,41 @@ class ArduinoApp(QMainWindow):
         row = 0
 
         for key, value in self.data.items():
-            if key in self.received_data and self.received_data[key]['value'] == value:
+            if key in self.derived_channels:
+                source = "Derived"
+                stats = None
+            elif key in self.received_data and self.received_data[key]['value'] == value:
                 source = "From Arduino"
-                buf = self.received_update_times_buffer.get(key, deque())
-                baseline_ms = self.received_baseline_averages.get(key)
-            elif key in self.sent_attempt_times_buffer:
+                stats = self.received_interval_stats.get(key)
+                staleness = self.received_staleness
+            elif key in self.sent_interval_stats:
                 source = "To Arduino"
-                buf = self.sent_attempt_times_buffer.get(key, deque())
-                baseline_ms = self.sent_baseline_averages.get(key)
+                stats = self.sent_interval_stats.get(key)
+                staleness = self.sent_staleness
             else:
                 source = "Unknown"
-                buf = deque()
-                baseline_ms = None
+                stats = None
 
-            if baseline_ms is None or len(buf) < 2:
+            baseline = stats.baseline(self.baseline_min_samples) if stats else None
+            if baseline is None:
                 age_item_text = "N/A"
                 exceeds_threshold = False
+                age_tooltip = ""
             else:
-                intervals = [buf[i] - buf[i - 1] for i in range(1, len(buf))]
-                partial = current_time - buf[-1]
-                all_intervals = intervals + [partial]
-                avg_int_sec = sum(all_intervals) / len(all_intervals)
-                avg_interval_ms = int(avg_int_sec * 1000)
-
-                threshold_ms = baseline_ms * (1 + self.threshold_percentage)
-                exceeds_threshold = avg_interval_ms > threshold_ms
+                # The recent average, stretched by however long it has been quiet
+                avg_interval_ms = int(stats.average_with_gap(current_time) * 1000)
+                exceeds_threshold = staleness.is_stale(key)
                 age_item_text = f"{avg_interval_ms} ms"
+                summary = stats.summary()
+                age_tooltip = (f"Jitter ±{summary['jitter_ms']} ms\n"
+                               f"Mean {summary['mean_ms']} ms (recent {summary['ewma_ms']} ms)\n"
+                               f"Min {summary['min_ms']} / max {summary['max_ms']} ms\n"
+                               f"p50 {summary['p50_ms']} / p95 {summary['p95_ms']} / p99 {summary['p99_ms']} ms")
 
             param_item = QTableWidgetItem(key)
-            value_item = QTableWidgetItem(str(value))
+            value_item = QTableWidgetItem(format_value(value))
             age_item = QTableWidgetItem(age_item_text)
+            age_item.setToolTip(age_tooltip)
             source_item = QTableWidgetItem(source)
 
             for item in (param_item, value_item, age_item, source_item):
@@ -1003,53 +2022,141 @@ class ArduinoApp(QMainWindow):
     # ----------------------------------------------------------------
     # Processing Outgoing Data
     # ----------------------------------------------------------------
-    def process_outgoing_data(self):
-        while len(self.outgoing_data) > 0:
-            post_data = self.outgoing_data.pop(0)
+    def route_outgoing(self, param):
+        """Return the session a posted key is meant for and the key to send it as."""
+        if not self.multi_device:
+            return next(iter(self.sessions.values()), None), param
+        device_id, sep, key = str(param).partition("/")
+        session = self.devices.get(device_id) if sep else None
+        return session, key
+
+    def process_outgoing_data(self, posted):
+        """
+        Queue a batch of (posted_at, data) from the server and write it right away.
+        An AtomicUpdate is dropped whole if any of its keys has no board, and
+        otherwise goes to each board as one group.
+        """
+        scheduler = self.write_scheduler
+        coalesced_before = scheduler.coalesced
+
+        for posted_at, post_data in posted:
             if not isinstance(post_data, dict):
                 logging.error(f"Invalid data: {post_data}. Expected dict.")
                 continue
 
+            routed = []
             for param, val in post_data.items():
                 if param is None or val is None:
                     logging.error(f"Invalid data entry: {param}={val}. Skipped.")
                     continue
 
-                now_ts = time.time()
-                buf = self.sent_attempt_times_buffer.setdefault(param, deque(maxlen=50))
-                buf.append(now_ts)
+                stats = self.sent_interval_stats.get(param)
+                if stats is None:
+                    stats = self.sent_interval_stats[param] = IntervalStats()
+                stats.record(time.time())
+                self.sent_staleness.seen(param, stats)
 
-                old_val = self.last_sent_values.get(param)
-                if old_val == val:
-                    logging.debug(f"No change in '{param}'; not sending to Arduino.")
-                else:
-                    if self.arduino and self.arduino.is_open:
-                        try:
-                            msg = f"{param}:{val}\n".encode('utf-8')
-                            self.arduino.write(msg)
-                            logging.info(f"Sent to Arduino: {param}={val}")
-                            self.last_sent_values[param] = val
-                            self.sent_data[param] = {'value': val, 'timestamp': now_ts}
-                            self.data[param] = val
-                        except serial.SerialException as e:
-                            logging.error(f"Failed to send data: {e}")
-                            self.handle_disconnect()
-                            break
+                session, device_key = self.route_outgoing(param)
+                routed.append((param, val, session, device_key))
+
+            atomic = isinstance(post_data, AtomicUpdate)
+            if atomic and any(session is None for _, _, session, _ in routed):
+                missing = [param for param, _, session, _ in routed if session is None]
+                logging.error(f"Atomic update of {len(routed)} values dropped; no connected Arduino for {missing}.")
+                continue
+
+            groups = {}  # session -> [(param, device_key, val)] of an atomic update
+            for param, val, session, device_key in routed:
+                if session is None:
+                    if self.multi_device:
+                        logging.error(f"No connected Arduino for '{param}'. Use '<device>/<key>'.")
                     else:
                         logging.error("Arduino not connected. Cannot send.")
+                elif self.last_sent_values.get(param) == val:
+                    logging.debug(f"No change in '{param}'; not sending to Arduino.")
+                    scheduler.discard(session, param)
+                elif atomic:
+                    groups.setdefault(session, []).append((param, device_key, val))
+                else:
+                    scheduler.submit(session, param, device_key, val, posted_at)
+            for session, entries in groups.items():
+                scheduler.submit_group(session, entries, posted_at)
+
+        self.flush_writes()
+
+        coalesced = scheduler.coalesced - coalesced_before
+        if coalesced or scheduler.backlog:
+            logging.info(f"Outgoing: {len(posted)} posts, {coalesced} values coalesced, "
+                         f"{scheduler.backlog} waiting for link budget.")
+        self.request_table_update()
+
+    def flush_backlog(self):
+        if self.flush_writes():
+            self.request_table_update()
+
+    def request_table_update(self):
+        if not self.table_refresh_timer.isActive():
+            self.table_refresh_timer.start()
+
+    def flush_writes(self):
+        """Write each board's pending values as one payload within its link budget."""
+        scheduler = self.write_scheduler
+        sent = 0
+        for session in scheduler.targets():
+            if not self.is_current(session):
+                scheduler.forget(session)
+                continue
+            if not session.is_open:
+                # Reconnecting; the values go out once the board is back
+                continue
 
-                new_baseline = self.calculate_baseline(buf, min_samples=20)
-                if new_baseline:
-                    self.sent_baseline_averages[param] = new_baseline
-
-                self.update_table()
+            payload, items = scheduler.next_batch(session)
+            if not items:
+                continue
+            try:
+                session.write(payload)
+            except serial.SerialException as e:
+                logging.error(f"Failed to send data: {e}")
+                self.on_device_error(session, str(e))
+                continue
+            scheduler.sent(session, items, len(payload))
+
+            now = time.monotonic()
+            now_ts = time.time()
+            for param, val, posted_at in items:
+                self.last_sent_values[param] = val
+                # The board got val as text; keep what it means
+                typed = self.sent_types.coerce(param, parse_value(val))
+                self.sent_data[param] = {'value': typed, 'timestamp': now_ts}
+                self.sent_history.append(param, typed, now_ts)
+                self.data[param] = typed
+                # The board's next report is compared with what it was sent
+                self.received_filter.posted(param, typed, now_ts)
+                if posted_at is not None:
+                    self.outgoing_latency.record(now - posted_at)
+            sent += len(items)
+            logging.info(f"Sent to Arduino ({len(payload)} bytes): "
+                         + ", ".join(f"{param}={val}" for param, val, _ in items))
+
+        # Keep retrying while values wait for link budget or a reconnect
+        if scheduler.backlog:
+            if not self.outgoing_timer.isActive():
+                self.outgoing_timer.start()
+        else:
+            self.outgoing_timer.stop()
+        return sent
 
     def closeEvent(self, event):
+        self.outgoing_listener.stop()
+        self.staleness_timer.stop()
+        if self.outgoing_latency.count:
+            logging.info(f"POST to serial latency: {self.outgoing_latency.summary()}")
         if self.is_server_running:
             self.stop_server()
-        if self.arduino and self.arduino.is_open:
-            self.arduino.close()
+        if self.sessions:
+            self.close_sessions()
             logging.info("Arduino closed on exit.")
+        self.staleness_status.close()
         event.accept()
 
 
@@ -1059,15 +2166,74 @@ class ArduinoApp(QMainWindow):
 if __name__ == '__main__':
     multiprocessing.freeze_support()
 
-    manager = multiprocessing.Manager()
-
-    # Manager dictionary for Arduino data
-    arduino_data = manager.dict()
-
-    # Manager list for data to send to Arduino
-    outgoing_data = manager.list()
-
-    qt_app = QApplication(sys.argv)
-    main_window = ArduinoApp(arduino_data, outgoing_data)
+    parser = argparse.ArgumentParser(description="Arduino Reader")
+    parser.add_argument("--binary", action="store_true",
+                        help="offer the compact binary protocol to the Arduino during the handshake")
+    parser.add_argument("--multi", action="store_true",
+                        help="connect to every Arduino found and prefix keys with the device name")
+    parser.add_argument("--no-reconnect", action="store_true",
+                        help="reset everything when a board drops out instead of reconnecting")
+    parser.add_argument("--capture", metavar="DIR",
+                        help="record every serial session to a capture file in this directory")
+    parser.add_argument("--replay", metavar="FILE",
+                        help="play a capture file back instead of searching for a board")
+    parser.add_argument("--replay-speed", type=float, default=1.0,
+                        help="replay speed as a multiple of real time; 0 is as fast as possible")
+    parser.add_argument("--server-mode", choices=("process", "thread"), default="process",
+                        help="run the local server in its own process or on a thread of the app")
+    parser.add_argument("--history", type=int, default=DEFAULT_CAPACITY, metavar="N",
+                        help="samples of history kept per key (at most 16 bytes each for numbers)")
+    parser.add_argument("--history-seconds", type=float, metavar="S",
+                        help="also drop history older than this many seconds")
+    parser.add_argument("--staleness-rules", metavar="FILE",
+                        help='JSON file of staleness rules per key, e.g. {"*": {"timeout": 5}, "temp": {"rate_floor": 2}}')
+    parser.add_argument("--deadband", type=float, default=0.0, metavar="X",
+                        help="numeric readings within X of the shown value don't count as a change")
+    parser.add_argument("--filter-rules", metavar="FILE",
+                        help='JSON file of change filters per key, e.g. '
+                             '{"*": {"deadband": 1}, "temp": {"deadband_percent": 2, "min_interval": 0.5}}')
+    parser.add_argument("--derived", metavar="FILE",
+                        help="file of derived channels, one 'name = expression' per line, "
+                             "e.g. 'temp_c = (raw_t * 0.488) - 50' or 'avg_load = mavg(load, 20)'. "
+                             "Expressions name channels as Python identifiers, so keys of other "
+                             "boards such as 'board1/temp' can't be used")
+    args, qt_args = parser.parse_known_args()
+
+    staleness_rules = None
+    if args.staleness_rules:
+        with open(args.staleness_rules) as f:
+            staleness_rules = json.load(f)
+
+    filter_rules = {}
+    if args.filter_rules:
+        with open(args.filter_rules) as f:
+            filter_rules = json.load(f)
+    if args.deadband:
+        filter_rules.setdefault("*", {}).setdefault("deadband", args.deadband)
+
+    derived_channels = None
+    if args.derived:
+        try:
+            with open(args.derived) as f:
+                derived_channels = DerivedChannels(parse_definitions(f.read()))
+        except ExpressionError as e:
+            parser.error(f"{args.derived}: {e}")
+
+    # Shared memory snapshot of the Arduino data, read by the server process
+    arduino_data = SnapshotStore()
+
+    # Pipe from the server process to the serial writer
+    outgoing_data = OutgoingChannel()
+
+    qt_app = QApplication(sys.argv[:1] + qt_args)
+    main_window = ArduinoApp(arduino_data, outgoing_data, binary_protocol=args.binary,
+                             multi_device=args.multi, auto_reconnect=not args.no_reconnect,
+                             capture_dir=args.capture, replay_path=args.replay,
+                             replay_speed=args.replay_speed, server_mode=args.server_mode,
+                             history_capacity=args.history, history_max_age=args.history_seconds,
+                             staleness_rules=staleness_rules, filter_rules=filter_rules,
+                             derived_channels=derived_channels)
     main_window.show()
-    sys.exit(qt_app.exec_())
\ No newline at end of file
+    exit_code = qt_app.exec_()
+    arduino_data.close()
+    sys.exit(exit_code)
\ No newline at end of file
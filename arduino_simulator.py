@@ -0,0 +1,320 @@
+"""
+Virtual Arduino on a pseudo-terminal, for load testing without hardware.
+
+Each VirtualArduino opens a pty pair and behaves like the reader sketch on
+the slave side, which pyserial opens like any other serial port:
+
+* until the host sends ``CONNECTED`` it announces the identifier
+  (``ARDUINO_READY``) a few times per second, which is what ArduinoSearcher
+  listens for;
+* on ``CONNECTED`` it answers ``NAME:<name>`` and starts streaming
+  ``sensor<N>:<value>`` lines at the configured rate, with optional jitter
+  and periodic bursts;
+* if binary mode is enabled and the host offers ``PROTOCOL:BIN1`` it
+  answers and switches to the binary protocol;
+* every ``key:value`` line it receives is echoed back and recorded.
+
+Closing the port on the host side behaves like a board reset: the
+simulator goes back to announcing itself. pyserial's port listing does not
+include ptys, so for ArduinoSearcher to find one pass ``link`` (e.g.
+``/dev/ttyACM90``) to publish it under a name the listing picks up.
+
+Linux/macOS only. Run ``python arduino_simulator.py --help`` for options.
+"""
+import argparse
+import errno
+import logging
+import os
+import random
+import select
+import threading
+import time
+import tty
+from collections import deque
+
+import binary_protocol
+
+
+class VirtualArduino:
+    def __init__(self, name="SimArduino", channels=4, rate=10.0, jitter=0.0,
+                 burst_every=0.0, burst_size=0, identifier="ARDUINO_READY",
+                 binary=False, link=None, announce_interval=0.25, seed=None):
+        """
+        rate is samples per second per channel; jitter is the +/- fraction of
+        the sample period each interval is randomised by. Every burst_every
+        seconds each channel additionally sends burst_size samples at once.
+        """
+        self.name = name
+        self.channels = channels
+        self.rate = rate
+        self.jitter = jitter
+        self.burst_every = burst_every
+        self.burst_size = burst_size
+        self.identifier = identifier
+        self.binary = binary
+        self.link = link
+        self.announce_interval = announce_interval
+
+        self.port = None
+        self.connected = False
+        self.lines_sent = 0
+        self.bytes_sent = 0
+        self.received = deque(maxlen=10000)  # (monotonic timestamp, line)
+
+        self._rng = random.Random(seed)
+        self._values = [self._rng.randint(0, 1023) for _ in range(channels)]
+        self._master = None
+        self._write_lock = threading.Lock()
+        self._thread = None
+        self._running = False
+        self._slave_open = False
+        self._binary_active = False
+        self._echo_channels = {}  # echoed key -> binary channel id
+        self._next_due = []
+
+    # ----------------------------------------------------------------
+    # Lifecycle
+    # ----------------------------------------------------------------
+    def start(self):
+        """Create the pty and start the board loop. Returns the port path to open."""
+        master, slave = os.openpty()
+        tty.setraw(slave)
+        self.port = os.ttyname(slave)
+        # Only the host keeps the slave open, so its close shows up as EIO here
+        os.close(slave)
+        os.set_blocking(master, False)
+        self._master = master
+
+        if self.link:
+            if os.path.islink(self.link):
+                os.unlink(self.link)
+            os.symlink(self.port, self.link)
+
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=f"VirtualArduino {self.name}", daemon=True)
+        self._thread.start()
+        return self.link or self.port
+
+    def stop(self):
+        self._running = False
+        if self._thread:
+            self._thread.join(2)
+            self._thread = None
+        if self._master is not None:
+            os.close(self._master)
+            self._master = None
+        if self.link and os.path.islink(self.link):
+            os.unlink(self.link)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    # ----------------------------------------------------------------
+    # Board loop
+    # ----------------------------------------------------------------
+    def _run(self):
+        pending = b""
+        period = 1.0 / self.rate if self.rate > 0 else None
+        next_announce = time.monotonic()
+        next_burst = time.monotonic() + self.burst_every if self.burst_every else None
+
+        while self._running:
+            now = time.monotonic()
+            timeout = 0.05
+            if self.connected and period:
+                deadline = min(self._next_due + ([next_burst] if next_burst else []))
+                timeout = min(timeout, max(0.0, deadline - now))
+            readable, _, _ = select.select([self._master], [], [], timeout)
+
+            if readable or not self._slave_open:
+                try:
+                    data = os.read(self._master, 4096)
+                except BlockingIOError:
+                    # The host has the port open but sent nothing
+                    data = b""
+                except OSError as e:
+                    if e.errno != errno.EIO:
+                        raise
+                    # Nobody has the port open: behave like a board waiting after reset
+                    if self._slave_open:
+                        self._reset()
+                    time.sleep(0.02)
+                    continue
+                self._slave_open = True
+                lines = (pending + data).split(b"\n")
+                pending = lines.pop()
+                for line in lines:
+                    self._handle_line(line.decode('utf-8', errors='replace').strip())
+
+            now = time.monotonic()
+            if not self.connected:
+                if now >= next_announce:
+                    self._send_lines([self.identifier])
+                    next_announce = now + self.announce_interval
+                continue
+
+            if period is None:
+                continue
+
+            samples = []
+            next_due = self._next_due
+            for channel in range(self.channels):
+                while next_due[channel] <= now:
+                    samples.append(channel)
+                    spread = self._rng.uniform(-self.jitter, self.jitter) if self.jitter else 0.0
+                    next_due[channel] += period * (1 + spread)
+            if next_burst and now >= next_burst:
+                samples.extend(list(range(self.channels)) * self.burst_size)
+                next_burst = now + self.burst_every
+            if samples:
+                self._send_samples(samples)
+
+    def _reset(self):
+        self._slave_open = False
+        self.connected = False
+        self._binary_active = False
+        self._echo_channels.clear()
+
+    def _handle_line(self, line):
+        if not line:
+            return
+        self.received.append((time.monotonic(), line))
+
+        if line == "CONNECTED":
+            self.connected = True
+            self._next_due = [time.monotonic()] * self.channels
+            self._send_lines([f"NAME:{self.name}"])
+            return
+
+        key, sep, value = line.partition(":")
+        if not sep:
+            return
+        if key == "PROTOCOL":
+            if self.binary and value == binary_protocol.PROTOCOL_NAME:
+                self._start_binary()
+            return
+        self._echo(key, value)
+
+    # ----------------------------------------------------------------
+    # Output
+    # ----------------------------------------------------------------
+    def _next_value(self, channel):
+        value = min(1023, max(0, self._values[channel] + self._rng.randint(-2, 2)))
+        self._values[channel] = value
+        return value
+
+    def _send_samples(self, channels):
+        if self._binary_active:
+            types = {channel + 1: binary_protocol.TYPE_INT16 for channel in range(self.channels)}
+            samples = [(channel + 1, self._next_value(channel)) for channel in channels]
+            # Keep packets short so a lost byte costs few samples
+            payload = b"".join(binary_protocol.encode_samples(samples[i:i + 32], types)
+                               for i in range(0, len(samples), 32))
+            self._write(payload, len(samples))
+        else:
+            self._send_lines([f"sensor{channel}:{self._next_value(channel)}" for channel in channels])
+
+    def send_line(self, line):
+        """Send one extra text line as if the sketch printed it (safe from any thread)."""
+        self._send_lines([line])
+
+    def _send_lines(self, lines):
+        self._write("".join(f"{line}\r\n" for line in lines).encode('utf-8'), len(lines))
+
+    def _start_binary(self):
+        self._send_lines([f"PROTOCOL:{binary_protocol.PROTOCOL_NAME}"])
+        self._binary_active = True
+        definitions = b"".join(
+            binary_protocol.encode_channel_definition(channel + 1, binary_protocol.TYPE_INT16, f"sensor{channel}")
+            for channel in range(self.channels))
+        self._write(definitions, 0)
+
+    def _echo(self, key, value):
+        if not self._binary_active:
+            self._send_lines([f"{key}:{value}"])
+            return
+        try:
+            number = float(value)
+        except ValueError:
+            return
+        channel_id = self._echo_channels.get(key)
+        if channel_id is None:
+            channel_id = self._echo_channels[key] = 200 + len(self._echo_channels)
+            self._write(binary_protocol.encode_channel_definition(
+                channel_id, binary_protocol.TYPE_FLOAT32, key), 0)
+        self._write(binary_protocol.encode_samples(
+            [(channel_id, number)], {channel_id: binary_protocol.TYPE_FLOAT32}), 1)
+
+    def _write(self, data, line_count):
+        """Write data whole, or drop all of it if the host has stopped reading."""
+        remaining = memoryview(data)
+        with self._write_lock:
+            while remaining:
+                try:
+                    written = os.write(self._master, remaining)
+                except BlockingIOError:
+                    if len(remaining) == len(data):
+                        # Host is not reading fast enough; a real UART would drop these too
+                        return
+                    # Finish what was started, so the host never gets half a line
+                    select.select([], [self._master], [], 0.05)
+                    if not self._running:
+                        return
+                    continue
+                except OSError as e:
+                    if e.errno != errno.EIO:
+                        raise
+                    self._reset()
+                    return
+                self.bytes_sent += written
+                remaining = remaining[written:]
+            self.lines_sent += line_count
+
+
+# --------------------------------------------------------------------
+# Command line
+# --------------------------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Run virtual Arduinos on pseudo-terminals.")
+    parser.add_argument("--count", type=int, default=1, help="number of boards")
+    parser.add_argument("--name", default="SimArduino", help="board name (numbered when --count > 1)")
+    parser.add_argument("--channels", type=int, default=4, help="sensor channels per board")
+    parser.add_argument("--rate", type=float, default=10.0, help="samples per second per channel")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- fraction of the sample period")
+    parser.add_argument("--burst-every", type=float, default=0.0, help="seconds between bursts")
+    parser.add_argument("--burst-size", type=int, default=0, help="extra samples per channel in a burst")
+    parser.add_argument("--binary", action="store_true", help="accept the binary protocol if offered")
+    parser.add_argument("--link", help="symlink the port here, e.g. /dev/ttyACM90 (numbered when --count > 1)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    boards = []
+    for index in range(args.count):
+        suffix = "" if args.count == 1 else str(index)
+        board = VirtualArduino(
+            name=f"{args.name}{suffix}", channels=args.channels, rate=args.rate, jitter=args.jitter,
+            burst_every=args.burst_every, burst_size=args.burst_size, binary=args.binary,
+            link=f"{args.link}{suffix}" if args.link else None)
+        logging.info(f"{board.name} listening on {board.start()}")
+        boards.append(board)
+
+    try:
+        while True:
+            time.sleep(5)
+            for board in boards:
+                logging.info(f"{board.name}: {board.lines_sent} lines, {board.bytes_sent} bytes sent, "
+                             f"{len(board.received)} lines received")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for board in boards:
+            board.stop()
+
+
+if __name__ == '__main__':
+    main()
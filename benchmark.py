@@ -0,0 +1,998 @@
+"""
+Benchmarks for the Arduino reader.
+
+Run with ``python benchmark.py``. Everything runs headless: the Qt parts use
+the offscreen platform and the serial side is a VirtualArduino on a pty, so
+no board or display is needed (the end-to-end benchmark needs Linux/macOS).
+
+    python benchmark.py --output results.json
+    python benchmark.py --output new.json --compare results.json
+
+Results are written as JSON so runs from different commits can be compared.
+"""
+import argparse
+import http.client
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from interval_stats import IntervalStats
+from staleness import StalenessEngine
+from line_parser import KeyValueParser
+from outgoing_channel import OutgoingChannel
+from shared_snapshot import SnapshotStore
+import websocket_link
+
+
+# --------------------------------------------------------------------
+# Workloads
+# --------------------------------------------------------------------
+def make_stream(lines=200000, channels=8, change_ratio=0.2, seed=1):
+    """Build a serial byte stream of ``key:value`` lines like a sensor sketch sends."""
+    rng = random.Random(seed)
+    values = [rng.randint(0, 1023) for _ in range(channels)]
+    out = []
+    for i in range(lines):
+        channel = i % channels
+        if rng.random() < change_ratio:
+            values[channel] = rng.randint(0, 1023)
+        out.append(f"sensor{channel}:{values[channel]}\r\n")
+    return "".join(out).encode('utf-8')
+
+
+def chunked(stream, chunk_size):
+    return [stream[i:i + chunk_size] for i in range(0, len(stream), chunk_size)]
+
+
+# --------------------------------------------------------------------
+# Parsers
+# --------------------------------------------------------------------
+def parse_readline(stream):
+    """
+    The per-line parsing the old QTimer-driven read_data did, reading from an
+    in-memory stream. pyserial's own readline() is slower still because it
+    reads one byte per call.
+    """
+    source = io.BytesIO(stream)
+    parsed = 0
+    while True:
+        raw = source.readline()
+        if not raw:
+            break
+        line = raw.decode('utf-8').strip()
+        if ":" in line:
+            key, value = line.split(":", 1)
+            key, value = key.strip(), value.strip()
+            if key.lower() == "name":
+                continue
+            parsed += 1
+    return parsed
+
+
+def parse_key_value_parser(chunks):
+    parser = KeyValueParser()
+    parsed = 0
+    for chunk in chunks:
+        records, _ = parser.feed(chunk, 0.0)
+        parsed += len(records)
+    return parsed
+
+
+# --------------------------------------------------------------------
+# Runner
+# --------------------------------------------------------------------
+def measure(func, *args, repeat=5):
+    """Return (items, best seconds) over ``repeat`` runs."""
+    best = None
+    items = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        items = func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return items, best
+
+
+def summarize_ms(samples):
+    """Latency summary in milliseconds for a list of durations in seconds."""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def percentile(fraction):
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 3)
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def free_tcp_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_http(port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.02)
+    raise RuntimeError(f"HTTP server on port {port} did not start")
+
+
+_qt_app = None
+_windows = []
+_stores = []
+
+
+def qt_application():
+    """The shared QApplication; kept referenced so it outlives every widget."""
+    global _qt_app
+    if _qt_app is None:
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        from PyQt5.QtWidgets import QApplication
+        _qt_app = QApplication.instance() or QApplication([])
+    return _qt_app
+
+
+def make_store(values=None):
+    """A SnapshotStore, freed by close_store() or when the benchmarks finish."""
+    store = SnapshotStore()
+    if values:
+        store.update(values)
+    _stores.append(store)
+    return store
+
+
+def close_store(store):
+    """Free a store from make_store() as soon as its benchmark is done with it."""
+    if isinstance(store, SnapshotStore) and store in _stores:
+        _stores.remove(store)
+        store.close()
+
+
+def make_app(arduino_data=None):
+    """
+    A headless ArduinoApp backed by a fresh data store and outgoing channel.
+    The window is kept referenced until exit, like in the real app:
+    destroying it earlier deletes layout items twice.
+    """
+    import arduino_reader_final
+    qt_application()
+    if arduino_data is None:
+        arduino_data = make_store()
+    app = arduino_reader_final.ArduinoApp(arduino_data, OutgoingChannel(), auto_reconnect=False)
+    _windows.append(app)
+    return app
+
+
+def close_app(app):
+    """Close a window from make_app() and free its data store."""
+    app.close()
+    # Nothing may publish to the store once it is freed
+    app.release_timer.stop()
+    close_store(app.arduino_data)
+
+
+# --------------------------------------------------------------------
+# Benchmarks
+# --------------------------------------------------------------------
+def bench_parsing():
+    stream = make_stream()
+    results = {}
+    lines, seconds = measure(parse_readline, stream)
+    results["readline_lines_per_s"] = round(lines / seconds)
+    for chunk_size in (64, 1024, 4096):
+        lines, seconds = measure(parse_key_value_parser, chunked(stream, chunk_size))
+        results[f"parser_{chunk_size}b_lines_per_s"] = round(lines / seconds)
+    return results
+
+
+def bench_read_data(lines=50000, batch_size=64):
+    """
+    Lines per second through ArduinoApp.read_data, including the data store
+    writes, with the shared memory store and with the old Manager dict.
+    """
+    import arduino_reader_final
+    records, _ = KeyValueParser().feed(make_stream(lines=lines), time.time())
+    batches = [records[i:i + batch_size] for i in range(0, len(records), batch_size)]
+
+    results = {"batch_size": batch_size}
+    with multiprocessing.Manager() as manager:
+        for store_name, arduino_data in (("shared_memory", make_store()), ("manager", manager.dict())):
+            app = make_app(arduino_data)
+            app.sessions["bench"] = arduino_reader_final.DeviceSession("bench")
+
+            start = time.perf_counter()
+            for batch in batches:
+                app.read_data(batch)
+            elapsed = time.perf_counter() - start
+
+            app.sessions.clear()
+            close_app(app)
+            results[f"{store_name}_lines_per_s"] = round(len(records) / elapsed)
+    return results
+
+
+def bench_change_filter(keys=20, readings=50000, batch_size=64):
+    """
+    Snapshot publishes and changes published for noisy analog channels
+    (512 +/- 2 counts) through read_data, without filters, with a deadband
+    of 4 counts, and with a 2% deadband plus a 0.5 s min_interval.
+    """
+    import arduino_reader_final
+    rng = random.Random(1)
+    now = time.time()
+    records = [(f"analog{i % keys}", 512 + rng.randint(-2, 2), now + i * 0.0001) for i in range(readings)]
+    batches = [records[i:i + batch_size] for i in range(0, len(records), batch_size)]
+
+    results = {"readings": readings}
+    for name, rules in (("unfiltered", {}),
+                        ("deadband_4", {"*": {"deadband": 4}}),
+                        ("percent_min_interval", {"*": {"deadband_percent": 2, "min_interval": 0.5}})):
+        app = make_app()
+        app.apply_filter_rules(rules)
+        app.sessions["bench"] = arduino_reader_final.DeviceSession("bench")
+        version = app.arduino_data.snapshot.version
+
+        start = time.perf_counter()
+        for batch in batches:
+            app.read_data(batch)
+        elapsed = time.perf_counter() - start
+
+        results[name] = {
+            "lines_per_s": round(readings / elapsed),
+            "changes": readings - app.received_filter.suppressed,
+            "publishes": app.arduino_data.snapshot.version - version,
+            "history_samples": sum(len(app.received_history.get(key)) for key in app.received_history.keys()),
+        }
+        app.sessions.clear()
+        close_app(app)
+    return results
+
+
+def bench_derived(inputs=100, readings=50000, batch_size=64):
+    """
+    read_data lines per second without derived channels and with 300 of
+    them over 100 inputs: a scaling, a sum of two inputs and a 20-sample
+    moving average per input.
+    """
+    import arduino_reader_final
+    from derived_channels import DerivedChannels
+
+    definitions = {}
+    for i in range(inputs):
+        definitions[f"scaled{i}"] = f"(raw{i} * 0.488) - 50"
+        definitions[f"sum{i}"] = f"raw{i} + raw{(i + 1) % inputs}"
+        definitions[f"avg{i}"] = f"mavg(raw{i}, 20)"
+    rng = random.Random(1)
+    now = time.time()
+    records = [(f"raw{i % inputs}", rng.randint(0, 1023), now + i * 0.0001) for i in range(readings)]
+    batches = [records[i:i + batch_size] for i in range(0, len(records), batch_size)]
+
+    results = {"inputs": inputs, "readings": readings}
+    for name, engine in (("no_derived", None), ("derived_300", DerivedChannels(definitions))):
+        app = make_app()
+        if engine is not None:
+            app.derived_channels = engine
+        app.sessions["bench"] = arduino_reader_final.DeviceSession("bench")
+
+        start = time.perf_counter()
+        for batch in batches:
+            app.read_data(batch)
+        elapsed = time.perf_counter() - start
+
+        results[f"{name}_lines_per_s"] = round(readings / elapsed)
+        results[f"{name}_keys"] = len(app.data)
+        app.sessions.clear()
+        close_app(app)
+    return results
+
+
+def bench_data_store(key_counts=(10, 100, 1000), changed_keys=8, repeat=200):
+    """
+    Microseconds to publish a batch of changed keys and to take the snapshot
+    a GET returns, for the shared memory store and for a Manager dict.
+    """
+    from flask import json as flask_json
+
+    results = {}
+    with multiprocessing.Manager() as manager:
+        for count in key_counts:
+            values = {f"sensor{i}": str(i) for i in range(count)}
+            changed = [{f"sensor{i}": str(round_ + i) for i in range(min(changed_keys, count))}
+                       for round_ in range(repeat)]
+
+            store = make_store(values)
+            manager_dict = manager.dict(values)
+            for store_name, target in (("shared_memory", store), ("manager", manager_dict)):
+                start = time.perf_counter()
+                for batch in changed:
+                    target.update(batch)
+                results[f"{store_name}_publish_{count}_keys_us"] = round(
+                    (time.perf_counter() - start) / repeat * 1e6, 1)
+
+            snapshot = store.snapshot
+            start = time.perf_counter()
+            for _ in range(repeat):
+                snapshot.read()
+            results[f"shared_memory_snapshot_{count}_keys_us"] = round((time.perf_counter() - start) / repeat * 1e6, 1)
+
+            start = time.perf_counter()
+            for _ in range(repeat):
+                # What the Manager-backed GET handler did: copy over IPC, then encode
+                flask_json.dumps(dict(manager_dict))
+            results[f"manager_snapshot_{count}_keys_us"] = round((time.perf_counter() - start) / repeat * 1e6, 1)
+            close_store(store)
+    return results
+
+
+def bench_time_series(keys=100, samples=100000):
+    """Append cost and memory of the per-key history, per value type."""
+    from time_series import TimeSeriesStore
+
+    results = {"keys": keys}
+    for name, make_value in (("float", lambda i: i * 0.5), ("int", int), ("bool", lambda i: i % 2 == 0),
+                             ("text", lambda i: f"state{i % 3}")):
+        store = TimeSeriesStore()
+        readings = [(f"sensor{i % keys}", make_value(i), 1000.0 + i * 0.001) for i in range(samples)]
+        start = time.perf_counter()
+        for key, value, timestamp in readings:
+            store.append(key, value, timestamp)
+        elapsed = time.perf_counter() - start
+        results[name] = {
+            "append_us": round(elapsed / samples * 1e6, 3),
+            "bytes_per_sample": store.memory_bytes / (keys * store.capacity),
+            "bytes_total": store.memory_bytes,
+        }
+    return results
+
+
+def bench_interval_stats(samples=100000):
+    """Microseconds per IntervalStats.record() and per summary() (what a table row reads)."""
+    stats = IntervalStats()
+    rng = random.Random(1)
+    timestamps = []
+    now = 1000.0
+    for _ in range(samples):
+        now += rng.gauss(0.1, 0.01)
+        timestamps.append(now)
+
+    start = time.perf_counter()
+    for timestamp in timestamps:
+        stats.record(timestamp)
+    record_us = (time.perf_counter() - start) / samples * 1e6
+    _, summary_seconds = measure(stats.summary, repeat=200)
+    summary = stats.summary()
+    return {
+        "record_us": round(record_us, 3),
+        "summary_us": round(summary_seconds * 1e6, 2),
+        "mean_ms": summary["mean_ms"],
+        "jitter_ms": summary["jitter_ms"],
+        "p50_ms": summary["p50_ms"],
+        "p99_ms": summary["p99_ms"],
+    }
+
+
+def bench_staleness(channels=10000):
+    """Milliseconds per StalenessEngine.evaluate() pass over N channels, with and without transitions."""
+    engine = StalenessEngine(timeout=5)
+    now = 1000.0
+    for index in range(channels):
+        stats = IntervalStats()
+        for step in range(30):
+            stats.record(now + step * 0.1)
+        engine.seen(f"key{index}", stats)
+    now += 3
+
+    _, quiet_seconds = measure(lambda: engine.evaluate(now), repeat=20)
+    start = time.perf_counter()
+    stale = len(engine.evaluate(now + 60))
+    transition_seconds = time.perf_counter() - start
+    return {
+        "channels": channels,
+        "no_change_ms": round(quiet_seconds * 1000, 3),
+        "all_stale_ms": round(transition_seconds * 1000, 3),
+        "went_stale": stale,
+    }
+
+
+def bench_update_table(key_counts=(10, 100, 1000), repeat=5):
+    """Milliseconds per update_table() call with N keys, each with a full timestamp history."""
+    app = make_app()
+    results = {}
+    for count in key_counts:
+        app.clear_data()
+        now = time.time()
+        history = [now - 5 + i * 0.1 for i in range(50)]
+        batch = [(f"key{index}", str(index), ts) for ts in history for index in range(count)]
+        for key, value, ts in batch:
+            app.data[key] = value
+            app.received_data[key] = {'value': value, 'timestamp': ts}
+            app.received_interval_stats.setdefault(key, IntervalStats()).record(ts)
+
+        _, seconds = measure(app.update_table, repeat=repeat)
+        results[f"{count}_keys_ms"] = round(seconds * 1000, 3)
+    close_app(app)
+    return results
+
+
+def start_http_server(snapshot, outgoing_data, mode="process"):
+    """Start the server the way ArduinoApp does; returns (stop function, port)."""
+    import arduino_reader_final
+    port = free_tcp_port()
+    if mode == "thread":
+        server = arduino_reader_final.InProcessServer('127.0.0.1', port, snapshot, outgoing_data)
+        server.start()
+        wait_for_http(port)
+        return server.stop, port
+
+    process = multiprocessing.Process(
+        target=arduino_reader_final.run_flask_app,
+        args=('127.0.0.1', port, snapshot, outgoing_data))
+    process.start()
+    wait_for_http(port)
+
+    def stop():
+        process.terminate()
+        process.join()
+    return stop, port
+
+
+def http_get_ready(port, timeout=10.0):
+    """Poll GET / until the server answers; raises if it never does."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            connection.request("GET", "/")
+            connection.getresponse().read()
+            connection.close()
+            return
+        except OSError:
+            time.sleep(0.001)
+    raise RuntimeError(f"HTTP server on port {port} did not answer")
+
+
+def bench_http(requests=500, keys=100):
+    """GET and POST latency and throughput with the server in its own process and on a thread."""
+    arduino_data = make_store({f"sensor{i}": str(i) for i in range(keys)})
+    results = {"keys": keys}
+    for mode in ("process", "thread"):
+        outgoing_data = OutgoingChannel()
+        stop, port = start_http_server(arduino_data.snapshot, outgoing_data, mode)
+
+        # Stand in for the GUI so the pipe never fills up
+        draining = threading.Event()
+
+        def drain():
+            while not draining.is_set():
+                outgoing_data.receive(timeout=0.1)
+
+        drainer = threading.Thread(target=drain, daemon=True)
+        drainer.start()
+        results[mode] = {}
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            connection.request("GET", "/")
+            etag = connection.getresponse().getheader("ETag")
+            cases = {
+                "GET": {},
+                "GET_304": {"If-None-Match": etag},
+                "GET_gzip": {"Accept-Encoding": "gzip"},
+                "POST": {"Content-Type": "application/json"},
+            }
+            for name, headers in cases.items():
+                method = name.split("_")[0]
+                latencies, sizes = [], []
+                start = time.perf_counter()
+                for i in range(requests):
+                    body = json.dumps({"led": i}) if method == "POST" else None
+                    sent = time.perf_counter()
+                    connection.request(method, "/", body=body, headers=headers)
+                    response = connection.getresponse()
+                    sizes.append(len(response.read()))
+                    latencies.append(time.perf_counter() - sent)
+                elapsed = time.perf_counter() - start
+                results[mode][name] = summarize_ms(latencies)
+                results[mode][name]["requests_per_s"] = round(requests / elapsed)
+                results[mode][name]["bytes"] = round(statistics.fmean(sizes))
+            connection.close()
+        finally:
+            stop()
+            draining.set()
+            drainer.join()
+            outgoing_data.close()
+    close_store(arduino_data)
+    return results
+
+
+def bench_batch(values=500, repeat=5):
+    """
+    Milliseconds to get a sweep of values into the outgoing channel: one
+    POST / per value against a single /batch request as a JSON array and
+    as NDJSON.
+    """
+    store = make_store()
+    outgoing_data = OutgoingChannel()
+    stop, port = start_http_server(store.snapshot, outgoing_data, "thread")
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    updates = [{f"sweep{i}": str(i)} for i in range(values)]
+
+    def post(path, body, content_type="application/json"):
+        connection.request("POST", path, body=body, headers={"Content-Type": content_type})
+        connection.getresponse().read()
+
+    variants = {
+        "posts": lambda: [post("/", json.dumps(update)) for update in updates],
+        "array": lambda: post("/batch", json.dumps(updates)),
+        "ndjson": lambda: post("/batch", "".join(json.dumps(update) + "\n" for update in updates),
+                               "application/x-ndjson"),
+    }
+    results = {"values": values}
+    for name, send in variants.items():
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            send()
+            received = 0
+            while received < values:
+                received += sum(len(data) for _, data in outgoing_data.receive(timeout=5))
+            timings.append(time.perf_counter() - start)
+        results[f"{name}_ms"] = round(statistics.median(timings) * 1000, 2)
+
+    connection.close()
+    stop()
+    outgoing_data.close()
+    close_store(store)
+    return results
+
+
+def bench_server_start_stop(repeat=3):
+    """
+    Milliseconds from ArduinoApp.start_server() until GET / answers, and for
+    stop_server() to return, in both server modes.
+    """
+    app = make_app()
+    results = {}
+    for mode in ("process", "thread"):
+        app.server_mode = mode
+        started, stopped = [], []
+        for _ in range(repeat):
+            port = free_tcp_port()
+            app.port_input.setText(f"Port: {port}")
+            start = time.perf_counter()
+            app.start_server()
+            http_get_ready(port)
+            started.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            app.stop_server()
+            stopped.append(time.perf_counter() - start)
+        results[f"{mode}_start_ms"] = round(statistics.fmean(started) * 1000, 1)
+        results[f"{mode}_stop_ms"] = round(statistics.fmean(stopped) * 1000, 1)
+    close_app(app)
+    return results
+
+
+def read_sse_events(response):
+    """Yield (event, data) from a text/event-stream response."""
+    event, data = "message", []
+    while True:
+        line = response.readline()
+        if not line:
+            return
+        line = line.decode('utf-8').rstrip("\r\n")
+        if not line:
+            if data:
+                yield event, "\n".join(data)
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[6:].strip()
+        elif line.startswith("data:"):
+            data.append(line[5:].strip())
+
+
+def bench_delta(keys=500, changed_keys=5, requests=200, interval=0.005):
+    """
+    GET / against GET /?since=N when a few of many keys change between
+    polls: bytes and latency per request, and how soon a long poll
+    (&wait=ms) returns after an update.
+    """
+    store = make_store({f"sensor{i}": "0" for i in range(keys)})
+    outgoing_data = OutgoingChannel()
+    stop, port = start_http_server(store.snapshot, outgoing_data, "thread")
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+
+    def get(path):
+        connection.request("GET", path)
+        return connection.getresponse().read()
+
+    results = {"keys": keys, "changed_keys": changed_keys}
+    version = json.loads(get("/?since=0"))["version"]
+    for name in ("full", "since"):
+        sizes, latencies = [], []
+        for i in range(requests):
+            store.update({f"sensor{(i * changed_keys + k) % keys}": str(i) for k in range(changed_keys)})
+            start = time.perf_counter()
+            body = get("/" if name == "full" else f"/?since={version}")
+            latencies.append(time.perf_counter() - start)
+            sizes.append(len(body))
+            if name == "since":
+                version = json.loads(body)["version"]
+        results[name] = summarize_ms(latencies)
+        results[name]["bytes"] = round(statistics.fmean(sizes))
+
+    latencies = []
+    for i in range(requests // 4):
+        timer = threading.Timer(interval, lambda: store.update({"t": repr(time.monotonic())}))
+        timer.start()
+        body = json.loads(get(f"/?since={version}&wait=5000"))
+        latencies.append(time.monotonic() - float(body["values"]["t"]))
+        version = body["version"]
+    results["long_poll_wake"] = summarize_ms(latencies)
+
+    connection.close()
+    stop()
+    outgoing_data.close()
+    close_store(store)
+    return results
+
+
+def bench_stream(subscribers=50, updates=200, interval=0.005, keys=20):
+    """
+    Push latency of /stream: time from SnapshotStore.update() to the event
+    arriving at a client, with many other clients connected, in both
+    server modes. Each update changes one of ``keys`` keys to the current
+    monotonic time, so the receiving client can compute the latency.
+    """
+    results = {"subscribers": subscribers, "updates": updates}
+    for mode in ("process", "thread"):
+        store = make_store({f"sensor{i}": "0" for i in range(keys)})
+        outgoing_data = OutgoingChannel()
+        stop, port = start_http_server(store.snapshot, outgoing_data, mode)
+
+        latencies = []
+        received = [0] * subscribers
+        ready = threading.Barrier(subscribers + 1)
+
+        def client(index):
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+            connection.request("GET", "/stream")
+            response = connection.getresponse()
+            events = read_sse_events(response)
+            next(events)  # the initial snapshot
+            ready.wait()
+            try:
+                for event, data in events:
+                    arrived = time.monotonic()
+                    if event != "message":
+                        break
+                    for value in json.loads(data).values():
+                        received[index] += 1
+                        if index == 0:
+                            latencies.append(arrived - float(value))
+                    if received[index] >= updates:
+                        break
+            except OSError:
+                pass
+            connection.close()
+
+        threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(subscribers)]
+        for thread in threads:
+            thread.start()
+        ready.wait()
+
+        for i in range(updates):
+            store.update({f"sensor{i % keys}": repr(time.monotonic())})
+            time.sleep(interval)
+        for thread in threads:
+            thread.join(5)
+        stop()
+        outgoing_data.close()
+        close_store(store)
+
+        results[mode] = summarize_ms(latencies)
+        results[mode]["min_received"] = min(received)
+    return results
+
+
+def bench_websocket(commands=5000, updates=200, interval=0.005):
+    """
+    /ws in both server modes: how many commands per second one connection
+    gets into the outgoing channel and how long each takes, and the push
+    latency of value updates on the same connection.
+    """
+    store = make_store({"t": "0"})
+    results = {"commands": commands, "updates": updates}
+    for mode in ("process", "thread"):
+        outgoing_data = OutgoingChannel()
+        stop, port = start_http_server(store.snapshot, outgoing_data, mode)
+        ws = websocket_link.connect("127.0.0.1", port)
+        ws.receive()  # the initial snapshot
+
+        sent_at = [0.0] * commands
+        arrivals = []
+
+        def drain():
+            while len(arrivals) < commands:
+                posted = outgoing_data.receive(timeout=5)
+                if not posted:
+                    break
+                arrivals.extend(posted)
+
+        drainer = threading.Thread(target=drain, daemon=True)
+        drainer.start()
+        start = time.monotonic()
+        for i in range(commands):
+            sent_at[i] = time.monotonic()
+            ws.send(json.dumps({"led": i}))
+        drainer.join()
+        elapsed = max(posted_at for posted_at, _ in arrivals) - start
+        results[mode] = {
+            "commands_per_s": round(len(arrivals) / elapsed),
+            "command": summarize_ms([posted_at - sent_at[data["led"]] for posted_at, data in arrivals]),
+        }
+
+        latencies = []
+        for _ in range(updates):
+            store.update({"t": repr(time.monotonic())})
+            message = json.loads(ws.receive())
+            latencies.append(time.monotonic() - float(message["values"]["t"]))
+            time.sleep(interval)
+        results[mode]["update"] = summarize_ms(latencies)
+
+        ws.close()
+        stop()
+        outgoing_data.close()
+    close_store(store)
+    return results
+
+
+def bench_replay(lines=50000, chunk_size=256):
+    """
+    Lines per second from a capture file through SerialReader and read_data,
+    replayed as fast as possible. The capture is generated, so every run
+    feeds the app exactly the same bytes in the same chunks.
+    """
+    from PyQt5.QtCore import QTimer
+    from serial_capture import CaptureWriter
+
+    qt_app = qt_application()
+    app = make_app()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.cap")
+        with CaptureWriter(path) as capture:
+            capture.record(0, b"NAME:Bench\r\n")
+            for chunk in chunked(make_stream(lines=lines), chunk_size):
+                capture.record(0, chunk)
+
+        app.replay_path = path
+        app.replay_speed = 0
+
+        def check_finished():
+            connection = app.sessions[path].connection
+            if connection is not None and connection.finished:
+                # Deliver the batches still queued behind the last read
+                qt_app.processEvents()
+                qt_app.quit()
+
+        poll = QTimer()
+        poll.timeout.connect(check_finished)
+        start = time.perf_counter()
+        app.start_search()
+        poll.start(1)
+        qt_app.exec_()
+        elapsed = time.perf_counter() - start
+        poll.stop()
+        replayed = app.sessions[path].connection.bytes_read
+        app.handle_disconnect()
+    close_app(app)
+
+    return {
+        "lines_per_s": round(lines / elapsed),
+        "mb_per_s": round(replayed / elapsed / 1e6, 3),
+        "chunk_size": chunk_size,
+    }
+
+
+def bench_end_to_end(probes=20, timeout=5.0):
+    """
+    Latency from a POST to its bytes reaching the (virtual) board, and from
+    the board sending a line to that value being visible over HTTP.
+
+    The first leg waits for the probe in VirtualArduino.received, the second
+    injects a line on the board and polls GET / until it shows up.
+    """
+    from PyQt5.QtCore import QTimer
+    from arduino_simulator import VirtualArduino
+
+    qt_app = qt_application()
+    app = make_app()
+    board = VirtualArduino(name="Bench", channels=4, rate=20)
+    board.start()
+
+    port = free_tcp_port()
+    app.port_input.setText(f"Port: {port}")
+    app.connect_to_arduino(board.port)
+    app.start_server()
+
+    post_to_serial = []
+    serial_to_http = []
+    done = threading.Event()
+    errors = []
+
+    def wait_for_echo(line, since_index):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            received = list(board.received)
+            for ts, received_line in received[since_index:]:
+                if received_line == line:
+                    return ts
+            time.sleep(0.0005)
+        raise TimeoutError(f"'{line}' never reached the board")
+
+    def client():
+        try:
+            wait_for_http(port)
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            for value in range(probes):
+                since_index = len(board.received)
+                posted_at = time.monotonic()
+                connection.request("POST", "/", body=json.dumps({"probe": value}),
+                                   headers={"Content-Type": "application/json"})
+                connection.getresponse().read()
+
+                received_at = wait_for_echo(f"probe:{value}", since_index)
+                post_to_serial.append(received_at - posted_at)
+
+                board.send_line(f"reply:{value}")
+                sent_at = time.monotonic()
+                deadline = sent_at + timeout
+                while time.monotonic() < deadline:
+                    connection.request("GET", "/")
+                    data = json.loads(connection.getresponse().read() or b"{}")
+                    if data.get("reply") == value:
+                        serial_to_http.append(time.monotonic() - sent_at)
+                        break
+                else:
+                    raise TimeoutError(f"probe {value} never became visible over HTTP")
+            connection.close()
+        except Exception as e:
+            errors.append(repr(e))
+        finally:
+            done.set()
+
+    threading.Thread(target=client, daemon=True).start()
+    poll = QTimer()
+    poll.timeout.connect(lambda: done.is_set() and qt_app.quit())
+    poll.start(20)
+    qt_app.exec_()
+    poll.stop()
+
+    app.stop_server()
+    app.handle_disconnect()
+    close_app(app)
+    board.stop()
+
+    results = {
+        "post_to_serial": summarize_ms(post_to_serial),
+        "serial_to_http": summarize_ms(serial_to_http),
+        # Measured inside the app: server received the POST -> serial write returned
+        "post_to_write": app.outgoing_latency.summary(),
+    }
+    if errors:
+        results["errors"] = errors
+    return results
+
+
+BENCHMARKS = {
+    "parse": bench_parsing,
+    "read_data": bench_read_data,
+    "change_filter": bench_change_filter,
+    "derived": bench_derived,
+    "data_store": bench_data_store,
+    "time_series": bench_time_series,
+    "interval_stats": bench_interval_stats,
+    "staleness": bench_staleness,
+    "update_table": bench_update_table,
+    "replay": bench_replay,
+    "http": bench_http,
+    "batch": bench_batch,
+    "server_start_stop": bench_server_start_stop,
+    "delta": bench_delta,
+    "stream": bench_stream,
+    "websocket": bench_websocket,
+    "end_to_end": bench_end_to_end,
+}
+
+
+# --------------------------------------------------------------------
+# Reporting
+# --------------------------------------------------------------------
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def flatten(results, prefix=""):
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(current, baseline):
+    """Print every numeric metric next to its baseline value and the change in percent."""
+    old = flatten(baseline.get("results", {}))
+    new = flatten(current.get("results", {}))
+    print(f"\nCompared with {baseline.get('revision') or 'baseline'}:")
+    for name in sorted(new):
+        if name not in old or not old[name]:
+            continue
+        change = (new[name] - old[name]) / old[name] * 100
+        print(f"  {name:<48} {old[name]:>14,.3f} -> {new[name]:>14,.3f}  ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Arduino reader benchmarks")
+    parser.add_argument("--only", help=f"comma-separated subset of: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--compare", help="JSON results from an earlier run to compare against")
+    args = parser.parse_args()
+
+    selected = args.only.split(",") if args.only else list(BENCHMARKS)
+
+    report = {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": {},
+    }
+    try:
+        for name in selected:
+            print(f"Running {name}...", file=sys.stderr)
+            report["results"][name] = BENCHMARKS[name]()
+    finally:
+        for store in _stores:
+            store.close()
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    main()
@@ -0,0 +1,173 @@
+"""
+Compact binary framing for the Arduino link.
+
+The text protocol stays the default. A host that wants binary mode sends
+``PROTOCOL:BIN1`` right after ``CONNECTED``. A sketch that supports it sends
+its ``NAME:`` line as usual, answers with the text line ``PROTOCOL:BIN1`` and
+switches to binary for everything it sends afterwards. Older sketches ignore
+the unknown key, never answer, and the host keeps reading text. Commands
+from the host to the board stay ``key:value`` text in both modes.
+
+Every binary packet is COBS-encoded and terminated by a zero byte. The
+decoded packet ends with a big-endian CRC-16/CCITT-FALSE over the preceding
+bytes (``binascii.crc_hqx(data, 0xFFFF)``). Two packet types exist:
+
+    0x01 channel_id type name...      channel definition, sent once at startup
+    0x02 (channel_id value)...        one or more samples
+
+Type codes are 1 = int16, 2 = int32 and 3 = float32, all little-endian.
+An int16 sample costs 3 bytes plus the packet overhead, against 10-20 bytes
+for the same reading as a ``key:value`` line.
+"""
+import binascii
+import logging
+import struct
+
+PROTOCOL_NAME = "BIN1"
+PROTOCOL_REQUEST = f"PROTOCOL:{PROTOCOL_NAME}\n".encode('utf-8')
+
+PACKET_CHANNEL = 0x01
+PACKET_SAMPLES = 0x02
+
+TYPE_INT16 = 1
+TYPE_INT32 = 2
+TYPE_FLOAT32 = 3
+
+VALUE_FORMATS = {
+    TYPE_INT16: struct.Struct("<h"),
+    TYPE_INT32: struct.Struct("<i"),
+    TYPE_FLOAT32: struct.Struct("<f"),
+}
+
+
+# --------------------------------------------------------------------
+# COBS
+# --------------------------------------------------------------------
+def cobs_encode(data):
+    """Encode bytes so the result contains no zero byte."""
+    out = bytearray()
+    for block in bytes(data).split(b"\x00"):
+        while len(block) >= 254:
+            out.append(255)
+            out += block[:254]
+            block = block[254:]
+        out.append(len(block) + 1)
+        out += block
+    return bytes(out)
+
+
+def cobs_decode(data):
+    """Decode one COBS-encoded packet (without its zero terminator)."""
+    out = bytearray()
+    index = 0
+    length = len(data)
+    while index < length:
+        code = data[index]
+        if code == 0 or index + code > length + 1:
+            raise ValueError("Malformed COBS packet")
+        out += data[index + 1:index + code]
+        index += code
+        if code < 255 and index < length:
+            out.append(0)
+    return bytes(out)
+
+
+def crc16(data):
+    return binascii.crc_hqx(data, 0xFFFF)
+
+
+# --------------------------------------------------------------------
+# Encoding (used by simulators and tests)
+# --------------------------------------------------------------------
+def encode_packet(payload):
+    """Append the CRC, COBS-encode and terminate a packet payload."""
+    return cobs_encode(payload + struct.pack(">H", crc16(payload))) + b"\x00"
+
+
+def encode_channel_definition(channel_id, value_type, name):
+    return encode_packet(bytes((PACKET_CHANNEL, channel_id, value_type)) + name.encode('utf-8'))
+
+
+def encode_samples(samples, channel_types):
+    """Encode (channel_id, value) pairs using the types in channel_types."""
+    payload = bytearray((PACKET_SAMPLES,))
+    for channel_id, value in samples:
+        payload.append(channel_id)
+        payload += VALUE_FORMATS[channel_types[channel_id]].pack(value)
+    return encode_packet(bytes(payload))
+
+
+# --------------------------------------------------------------------
+# Decoding
+# --------------------------------------------------------------------
+class BinaryDecoder:
+    """
+    Incremental decoder for the binary protocol.
+
+    feed() returns (key, value, timestamp) tuples shaped exactly like the
+    records KeyValueParser produces, so the rest of the app does not care
+    which protocol the board speaks. Values are ints and floats.
+    """
+
+    def __init__(self, max_packet_length=1024):
+        self.max_packet_length = max_packet_length
+        self.channels = {}  # channel_id -> (name, struct, value_type)
+        self.packets = 0
+        self.crc_errors = 0
+        self.unknown_channels = 0
+        self._pending = b""
+
+    def feed(self, data, timestamp=None):
+        packets = (self._pending + data).split(b"\x00")
+        pending = packets.pop()
+        if len(pending) > self.max_packet_length:
+            pending = b""
+        self._pending = pending
+
+        records = []
+        for packet in packets:
+            if not packet:
+                continue
+            try:
+                payload = cobs_decode(packet)
+            except ValueError:
+                self.crc_errors += 1
+                continue
+            if len(payload) < 3 or crc16(payload[:-2]) != struct.unpack(">H", payload[-2:])[0]:
+                self.crc_errors += 1
+                continue
+            self.packets += 1
+            self._dispatch(payload[:-2], timestamp, records)
+        return records
+
+    def _dispatch(self, payload, timestamp, records):
+        packet_type = payload[0]
+
+        if packet_type == PACKET_CHANNEL and len(payload) >= 4:
+            channel_id, value_type = payload[1], payload[2]
+            if value_type not in VALUE_FORMATS:
+                logging.warning(f"Unknown value type {value_type} for channel {channel_id}.")
+                return
+            name = payload[3:].decode('utf-8', errors='replace').strip()
+            self.channels[channel_id] = (name, VALUE_FORMATS[value_type], value_type)
+            logging.info(f"Binary channel {channel_id} => '{name}'")
+
+        elif packet_type == PACKET_SAMPLES:
+            index = 1
+            length = len(payload)
+            while index < length:
+                channel = self.channels.get(payload[index])
+                if channel is None:
+                    # Without the definition the sample size is unknown; drop the rest
+                    self.unknown_channels += 1
+                    return
+                name, value_format, value_type = channel
+                end = index + 1 + value_format.size
+                if end > length:
+                    return
+                value = value_format.unpack_from(payload, index + 1)[0]
+                if value_type == TYPE_FLOAT32:
+                    # Rounded to float32 precision, so 0.1 stays 0.1
+                    value = float(f"{value:.7g}")
+                records.append((name, value, timestamp))
+                index = end
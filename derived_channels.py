@@ -0,0 +1,419 @@
+"""
+Channels computed from other channels.
+
+A derived channel is defined by an expression over channel names:
+
+    temp_c = (raw_t * 0.488) - 50
+    total = load_a + load_b
+    avg_load = mavg(load, 20)
+
+Expressions are parsed once with the ast module and only numbers, channel
+names, arithmetic, comparisons, and/or/not, ``x if c else y`` and calls of
+the functions below are accepted, so a definition can't reach anything
+but channel values. The checked tree is compiled to a code object that
+runs with no builtins.
+
+Pure functions: abs, min, max, round, sqrt, exp, log, log10, sin, cos,
+tan, floor, ceil, clamp(x, low, high).
+
+Window functions keep state over the samples of one channel and are
+updated incrementally with every sample, so they cost O(1) per sample
+whatever the window:
+
+    mavg(ch, n)   mean of the last n samples
+    mmin(ch, n)   smallest of the last n samples
+    mmax(ch, n)   largest of the last n samples
+    ewma(ch, a)   exponentially weighted mean with weight a for new samples
+
+Their first argument must be a channel name, the second a constant. The
+samples of a derived channel are the values it changes to. Non-numeric
+and NaN samples are left out of windows.
+
+Channel names in expressions are Python identifiers, so multi-device keys
+such as ``board1/temp`` can't be referenced: the ``/`` reads as division.
+A derived channel can't be named after a function, and it takes the
+place of any real channel with the same name; the app ignores that
+channel's readings and logs a warning.
+
+DerivedChannels keeps the dependency graph. feed() is called for every
+reading; it updates the windows that read that channel and marks the
+derived channels that use them, and when the value changed, the derived
+channels that use the value itself. recompute() then evaluates only the
+marked channels, in dependency order, once per batch, and passes on the
+ones whose value changed to the channels that use them.
+"""
+import ast
+import heapq
+import logging
+import math
+from collections import deque
+
+from value_types import values_differ
+
+
+class ExpressionError(ValueError):
+    """A definition that can't be compiled: bad syntax, an unknown function or a cycle."""
+
+
+class NoValue(Exception):
+    """A window that has no samples yet."""
+
+
+def clamp(value, low, high):
+    return low if value < low else high if value > high else value
+
+
+FUNCTIONS = {
+    "abs": abs, "min": min, "max": max, "round": round,
+    "sqrt": math.sqrt, "exp": math.exp, "log": math.log, "log10": math.log10,
+    "sin": math.sin, "cos": math.cos, "tan": math.tan,
+    "floor": math.floor, "ceil": math.ceil, "clamp": clamp,
+}
+
+_OPERATORS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow,
+              ast.UAdd, ast.USub, ast.Not, ast.And, ast.Or,
+              ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE)
+_NODES = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.BoolOp, ast.Compare, ast.IfExp,
+          ast.Call, ast.Name, ast.Load, ast.Constant) + _OPERATORS
+
+
+# --------------------------------------------------------------------
+# Windows
+# --------------------------------------------------------------------
+def _is_sample(value):
+    return type(value) in (int, float) and value == value
+
+
+class MovingAverage:
+
+    def __init__(self, size):
+        self.size = size
+        self.reset()
+
+    def reset(self):
+        self.window = deque(maxlen=self.size)
+        self.total = 0.0
+        self.pushed = 0
+
+    def push(self, value):
+        if not _is_sample(value):
+            return
+        window = self.window
+        if len(window) == window.maxlen:
+            self.total -= window[0]
+        window.append(value)
+        self.total += value
+        self.pushed += 1
+        if self.pushed % self.size == 0:
+            # Re-add now and then so rounding errors don't pile up
+            self.total = math.fsum(window)
+
+    def value(self):
+        if not self.window:
+            raise NoValue
+        return self.total / len(self.window)
+
+
+class MovingExtreme:
+    """Min (or max) of the last size samples, from a monotonic deque."""
+
+    def __init__(self, size, largest=False):
+        self.size = size
+        self.largest = largest
+        self.reset()
+
+    def reset(self):
+        self.candidates = deque()  # (index, value), values ascending (descending for max)
+        self.index = 0
+
+    def push(self, value):
+        if not _is_sample(value):
+            return
+        candidates = self.candidates
+        if self.largest:
+            while candidates and candidates[-1][1] <= value:
+                candidates.pop()
+        else:
+            while candidates and candidates[-1][1] >= value:
+                candidates.pop()
+        candidates.append((self.index, value))
+        if candidates[0][0] <= self.index - self.size:
+            candidates.popleft()
+        self.index += 1
+
+    def value(self):
+        if not self.candidates:
+            raise NoValue
+        return self.candidates[0][1]
+
+
+class ExponentialAverage:
+
+    def __init__(self, alpha):
+        self.alpha = alpha
+        self.reset()
+
+    def reset(self):
+        self.average = None
+
+    def push(self, value):
+        if not _is_sample(value):
+            return
+        if self.average is None:
+            self.average = float(value)
+        else:
+            self.average += self.alpha * (value - self.average)
+
+    def value(self):
+        if self.average is None:
+            raise NoValue
+        return self.average
+
+
+def _window_size(value):
+    if type(value) is not int or value < 1:
+        raise ExpressionError("the window must be a whole number of samples, at least 1")
+    return value
+
+
+def _weight(value):
+    if type(value) not in (int, float) or not 0 < value <= 1:
+        raise ExpressionError("the weight must be a number above 0 and at most 1")
+    return value
+
+
+WINDOWS = {
+    "mavg": lambda n: MovingAverage(_window_size(n)),
+    "mmin": lambda n: MovingExtreme(_window_size(n)),
+    "mmax": lambda n: MovingExtreme(_window_size(n), largest=True),
+    "ewma": lambda a: ExponentialAverage(_weight(a)),
+}
+
+
+# --------------------------------------------------------------------
+# Compiling
+# --------------------------------------------------------------------
+class _Compiler(ast.NodeTransformer):
+    """Checks a parsed expression and rewrites window calls and ** for evaluation."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.inputs = set()   # channel names read directly
+        self.windows = []     # (channel name, window, global name)
+
+    def generic_visit(self, node):
+        if not isinstance(node, _NODES):
+            raise ExpressionError(f"'{type(node).__name__}' is not allowed in an expression")
+        return super().generic_visit(node)
+
+    def visit_Constant(self, node):
+        if type(node.value) not in (int, float, bool):
+            raise ExpressionError(f"only numbers are allowed as constants, not {node.value!r}")
+        return node
+
+    def visit_Name(self, node):
+        if node.id in FUNCTIONS or node.id in WINDOWS:
+            raise ExpressionError(f"'{node.id}' is a function")
+        if node.id.startswith("_"):
+            raise ExpressionError(f"channel names used in expressions can't start with '_': {node.id}")
+        self.inputs.add(node.id)
+        return node
+
+    def visit_BinOp(self, node):
+        self.generic_visit(node)
+        if isinstance(node.op, ast.Pow):
+            # Float power: raises OverflowError instead of building a huge int
+            return ast.Call(func=ast.Name(id="_pow", ctx=ast.Load()), args=[node.left, node.right], keywords=[])
+        return node
+
+    def visit_Call(self, node):
+        if not isinstance(node.func, ast.Name) or node.keywords:
+            raise ExpressionError("only plain calls of the listed functions are allowed")
+        name = node.func.id
+        if name in FUNCTIONS:
+            node.args = [self.visit(argument) for argument in node.args]
+            return node
+        if name not in WINDOWS:
+            raise ExpressionError(f"unknown function '{name}'")
+
+        if (len(node.args) != 2 or not isinstance(node.args[0], ast.Name)
+                or not isinstance(node.args[1], ast.Constant)):
+            raise ExpressionError(f"{name}() takes a channel name and a constant, e.g. {name}(load, 20)")
+        source = node.args[0].id
+        try:
+            window = WINDOWS[name](node.args[1].value)
+        except ExpressionError as e:
+            raise ExpressionError(f"{name}(): {e}")
+        global_name = self.engine._add_window(window)
+        self.windows.append((source, window, global_name))
+        return ast.Call(func=ast.Name(id=global_name, ctx=ast.Load()), args=[], keywords=[])
+
+
+class DerivedChannel:
+
+    def __init__(self, name, expression, engine):
+        if not name.isidentifier() or name.startswith("_"):
+            raise ExpressionError(f"'{name}' can't be used as a derived channel name")
+        if name in FUNCTIONS or name in WINDOWS:
+            raise ExpressionError(f"'{name}' is a function and can't be used as a derived channel name")
+        self.name = name
+        self.expression = expression
+        try:
+            tree = ast.parse(expression.strip(), mode="eval")
+        except SyntaxError as e:
+            raise ExpressionError(f"{name}: {e.msg}")
+        compiler = _Compiler(engine)
+        try:
+            tree = ast.fix_missing_locations(compiler.visit(tree))
+        except ExpressionError as e:
+            raise ExpressionError(f"{name}: {e}")
+        self.code = compile(tree, f"<{name}>", "eval")
+        self.inputs = compiler.inputs
+        self.windows = compiler.windows
+        self.depends = self.inputs | {source for source, _, _ in self.windows}
+        self.index = 0  # position in dependency order
+        self.errors = 0
+        self.last_error = None
+
+
+def parse_definitions(text):
+    """{name: expression} from ``name = expression`` lines; blank lines and # comments are skipped."""
+    definitions = {}
+    for number, line in enumerate(text.splitlines(), 1):
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+        name, sep, expression = line.partition("=")
+        if not sep or not expression.strip() or expression.lstrip().startswith("="):
+            raise ExpressionError(f"line {number}: expected 'name = expression'")
+        definitions[name.strip()] = expression.strip()
+    return definitions
+
+
+# --------------------------------------------------------------------
+# Evaluating
+# --------------------------------------------------------------------
+class DerivedChannels:
+
+    def __init__(self, definitions=None):
+        self.channels = {}
+        self.define(definitions or {})
+
+    def define(self, definitions):
+        """Replace all definitions with {name: expression}. Raises ExpressionError."""
+        self._globals = {"__builtins__": {}, "_pow": math.pow, **FUNCTIONS}
+        self._window_count = 0
+        channels = {name: DerivedChannel(name, expression, self) for name, expression in definitions.items()}
+
+        # Dependency order (Kahn's algorithm); whatever is left is in a cycle
+        waiting = {name: {dep for dep in channel.depends if dep in channels}
+                   for name, channel in channels.items()}
+        users = {}
+        for name, deps in waiting.items():
+            for dep in deps:
+                users.setdefault(dep, []).append(name)
+        ready = sorted(name for name, deps in waiting.items() if not deps)
+        order = []
+        while ready:
+            name = ready.pop()
+            order.append(channels[name])
+            for user in users.get(name, ()):
+                waiting[user].discard(name)
+                if not waiting[user]:
+                    ready.append(user)
+        if len(order) < len(channels):
+            cycle = sorted(name for name, deps in waiting.items() if deps)
+            raise ExpressionError(f"derived channels depend on each other in a cycle: {', '.join(cycle)}")
+
+        self.channels = channels
+        self.order = order
+        # channel -> ([windows fed by it], [indexes of channels with those
+        # windows], [indexes of channels that use its value])
+        self.watch = {}
+        for index, channel in enumerate(order):
+            channel.index = index
+            for source, window, _ in channel.windows:
+                windows, window_users, _ = self.watch.setdefault(source, ([], [], []))
+                windows.append(window)
+                window_users.append(index)
+            for name in channel.inputs:
+                self.watch.setdefault(name, ([], [], []))[2].append(index)
+        self.clear()
+
+    def _add_window(self, window):
+        global_name = f"_w{self._window_count}"
+        self._window_count += 1
+        self._globals[global_name] = window.value
+        return global_name
+
+    def __contains__(self, name):
+        return name in self.channels
+
+    def __len__(self):
+        return len(self.channels)
+
+    def clear(self):
+        """Forget all values and window samples, keeping the definitions."""
+        self.values = {}
+        for channel in self.order:
+            for _, window, _ in channel.windows:
+                window.reset()
+        # Channels without inputs (constants) get computed on the next recompute()
+        self._dirty = list(range(len(self.order)))
+        self._queued = set(self._dirty)
+
+    @property
+    def dirty(self):
+        return bool(self._dirty)
+
+    def feed(self, key, value):
+        """Note a sample of key, a channel that derived channels use (see watch)."""
+        values = self.values
+        # Most readings repeat the last value, which changes nothing that reads it
+        changed = key not in values or values_differ(values[key], value)
+        values[key] = value
+        windows, window_users, users = self.watch[key]
+        for window in windows:
+            window.push(value)
+        queued = self._queued
+        for index in window_users:
+            if index not in queued:
+                queued.add(index)
+                heapq.heappush(self._dirty, index)
+        if changed:
+            for index in users:
+                if index not in queued:
+                    queued.add(index)
+                    heapq.heappush(self._dirty, index)
+
+    def recompute(self):
+        """Evaluate the channels marked since the last call. Returns [(name, value)] of the changed ones."""
+        dirty = self._dirty
+        queued = self._queued
+        values = self.values
+        env = self._globals
+        changed = []
+        while dirty:
+            index = heapq.heappop(dirty)
+            queued.discard(index)
+            channel = self.order[index]
+            try:
+                value = eval(channel.code, env, values)
+            except (NameError, NoValue):
+                # An input has no value yet
+                continue
+            except (ArithmeticError, ValueError, TypeError) as e:
+                channel.errors += 1
+                if channel.last_error != str(e):
+                    logging.warning(f"Derived channel '{channel.name}' = {channel.expression}: {e}")
+                channel.last_error = str(e)
+                continue
+            name = channel.name
+            if name in values and not values_differ(values[name], value):
+                continue
+            changed.append((name, value))
+            if name in self.watch:
+                self.feed(name, value)
+            else:
+                values[name] = value
+        return changed
@@ -0,0 +1,102 @@
+"""
+Connection handshake state machine.
+
+    OPENING --opened()--> SENDING --connected_sent()--> AWAITING_NAME
+    AWAITING_NAME --name_received() / poll() timeout--> STREAMING
+    any state --fail()--> FAILED
+
+The state machine never blocks or reads anything itself. Whoever owns the
+serial port feeds it events with a monotonic timestamp and asks poll()
+whether the NAME deadline has passed. Data lines that arrive while the
+name is still outstanding are only counted here; the caller keeps them.
+"""
+
+OPENING = "opening"
+SENDING = "sending"
+AWAITING_NAME = "awaiting_name"
+STREAMING = "streaming"
+FAILED = "failed"
+
+
+class Handshake:
+    def __init__(self, name_timeout=5.0):
+        self.name_timeout = name_timeout
+        self.state = OPENING
+        self.name = None
+        self.error = None
+        self.timed_out = False
+        self.early_lines = 0
+
+        self._started_at = None
+        self._opened_at = None
+        self._sent_at = None
+        self._first_byte_at = None
+        self._name_at = None
+        self._streaming_at = None
+
+    def start(self, now):
+        self._started_at = now
+
+    def opened(self, now):
+        self._opened_at = now
+        self.state = SENDING
+
+    def connected_sent(self, now):
+        self._sent_at = now
+        self.state = AWAITING_NAME
+
+    def data_received(self, now, lines=0):
+        """Record bytes (and the number of data lines in them) arriving from the board."""
+        if self._first_byte_at is None:
+            self._first_byte_at = now
+        if self.state == AWAITING_NAME:
+            self.early_lines += lines
+
+    def name_received(self, name, now):
+        """Record the board's name. Returns True if this completed the handshake."""
+        self.name = name
+        if self.state != AWAITING_NAME:
+            return False
+        self._name_at = now
+        self._stream(now)
+        return True
+
+    def poll(self, now):
+        """Give up on the name once the timeout passes. Returns True if that just happened."""
+        if self.state != AWAITING_NAME or now - self._sent_at < self.name_timeout:
+            return False
+        self.timed_out = True
+        self._stream(now)
+        return True
+
+    def fail(self, error, now):
+        self.error = error
+        self.state = FAILED
+        self._streaming_at = now
+
+    def _stream(self, now):
+        self._streaming_at = now
+        self.state = STREAMING
+
+    @property
+    def is_complete(self):
+        return self.state in (STREAMING, FAILED)
+
+    @property
+    def metrics(self):
+        """Handshake timings in milliseconds; None for steps that did not happen."""
+        def elapsed_ms(start, end):
+            if start is None or end is None:
+                return None
+            return round((end - start) * 1000, 1)
+
+        return {
+            "state": self.state,
+            "name": self.name,
+            "open_ms": elapsed_ms(self._started_at, self._opened_at),
+            "first_byte_ms": elapsed_ms(self._sent_at, self._first_byte_at),
+            "name_ms": elapsed_ms(self._sent_at, self._name_at),
+            "total_ms": elapsed_ms(self._started_at, self._streaming_at),
+            "early_lines": self.early_lines,
+            "timed_out": self.timed_out,
+        }
@@ -0,0 +1,113 @@
+"""
+Which readings count as a change worth publishing.
+
+Every reading goes into the history, but only a change is published to
+the table, GET /, the delta and streaming endpoints and the log. A noisy
+analog channel that wobbles by a count or two would otherwise publish on
+nearly every line. ChangeFilter applies per-channel rules:
+
+* deadband: a numeric reading within this of the last published value is
+  not a change
+* deadband_percent: the same, as a percentage of the last published value;
+  the wider of the two deadbands applies
+* min_interval: a change less than this many seconds after the last
+  published one is held back. The newest held value is released by
+  release() once the interval is over, so the last value of a burst is
+  never lost. A held change that goes back inside the deadband is dropped.
+
+Values are compared with value_types.values_differ(), so with no rules
+every change of value or type is published. A value written to the board
+replaces the published one through posted(), so a reading of the value
+from before the write counts as a change again.
+"""
+import math
+
+from value_types import values_differ
+
+_DEFAULT = object()
+
+
+class ChangeFilter:
+    """
+    deadband, deadband_percent and min_interval are the rules for channels
+    without their own.
+    """
+
+    def __init__(self, deadband=0.0, deadband_percent=0.0, min_interval=0.0):
+        self.default_rules = (deadband, deadband_percent, min_interval)
+        self._rules = {}     # key -> (deadband, deadband_percent, min_interval)
+        self.published = {}  # key -> (value, timestamp) last published
+        self.held = {}       # key -> (value, timestamp) waiting for min_interval
+        self.suppressed = 0  # readings that were not a change
+
+    def configure(self, key, deadband=_DEFAULT, deadband_percent=_DEFAULT, min_interval=_DEFAULT):
+        """Set a channel's rules; arguments left out keep their current value."""
+        current = self._rules.get(key, self.default_rules)
+        self._rules[key] = tuple(current[i] if value is _DEFAULT else (value or 0.0)
+                                 for i, value in enumerate((deadband, deadband_percent, min_interval)))
+
+    def offer(self, key, value, timestamp):
+        """Whether a reading is a change to publish now. If so, it becomes the published value."""
+        last = self.published.get(key)
+        if last is None:
+            self.published[key] = (value, timestamp)
+            return True
+
+        old, published_at = last
+        deadband, percent, min_interval = self._rules.get(key, self.default_rules)
+        if percent and type(old) in (int, float) and math.isfinite(old):
+            deadband = max(deadband, abs(old) * percent / 100)
+        if not values_differ(old, value, deadband):
+            self.suppressed += 1
+            if self.held:
+                # Back where it was; the held change no longer applies
+                self.held.pop(key, None)
+            return False
+        if min_interval and timestamp - published_at < min_interval:
+            self.suppressed += 1
+            self.held[key] = (value, timestamp)
+            return False
+
+        if self.held:
+            self.held.pop(key, None)
+        self.published[key] = (value, timestamp)
+        return True
+
+    def posted(self, key, value, timestamp):
+        """A value was written to the board and is now the one shown for key."""
+        last = self.published.get(key)
+        # The interval limits how often readings publish, so it keeps running
+        self.published[key] = (value, timestamp if last is None else last[1])
+        if self.held:
+            # Older than the posted value
+            self.held.pop(key, None)
+
+    def next_release(self):
+        """When the earliest held change may be published, or None if none is held."""
+        if not self.held:
+            return None
+        rules = self._rules
+        default = self.default_rules
+        published = self.published
+        return min(published[key][1] + rules.get(key, default)[2] for key in self.held)
+
+    def release(self, now):
+        """Publish held changes whose min_interval is over by now. Returns [(key, value, timestamp)]."""
+        released = []
+        for key, (value, timestamp) in list(self.held.items()):
+            if now - self.published[key][1] >= self._rules.get(key, self.default_rules)[2]:
+                del self.held[key]
+                # Published now, so the next interval starts now
+                self.published[key] = (value, now)
+                released.append((key, value, timestamp))
+        return released
+
+    def value(self, key, default=None):
+        """The last published value of key."""
+        last = self.published.get(key)
+        return default if last is None else last[0]
+
+    def clear(self):
+        self.published.clear()
+        self.held.clear()
+        self.suppressed = 0
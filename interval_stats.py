@@ -0,0 +1,140 @@
+"""
+Streaming statistics of the time between a channel's samples.
+
+IntervalStats takes one timestamp per sample and updates everything in
+constant time and memory:
+
+* count, mean and variance over the whole session (Welford's method)
+* an exponentially weighted mean and variance that follow the recent rate;
+  alpha is 2 / (span + 1), so the default span of 49 intervals weighs
+  about as much history as the old 50-timestamp window did
+* min and max
+* approximate quantiles from a log-bucketed sketch. Bucket bounds are
+  within relative_accuracy of each other, so a reported p50/p95/p99 is
+  within that fraction of the true interval. The bucket count grows with
+  the range of intervals seen (about 57 per decade at 2%), never with the
+  number of samples.
+
+Jitter is the exponentially weighted standard deviation: how much recent
+intervals vary around the recent mean.
+"""
+import math
+
+MIN_INTERVAL = 1e-6  # seconds; shorter intervals count as zero in the sketch
+
+
+class IntervalStats:
+
+    def __init__(self, span=49, relative_accuracy=0.02):
+        self.alpha = 2 / (span + 1)
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self.last = None
+        self.count = 0  # intervals, one fewer than timestamps
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.ewma = 0.0
+        self.ew_variance = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self._buckets = {}  # sketch bucket index -> count
+        self._zero = 0
+
+    def record(self, timestamp):
+        last = self.last
+        self.last = timestamp
+        if last is None:
+            return
+        interval = timestamp - last
+        if interval < 0:
+            # The wall clock went back; the next interval is fine again
+            return
+
+        self.count += 1
+        delta = interval - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (interval - self.mean)
+
+        if self.count == 1:
+            self.ewma = interval
+        else:
+            diff = interval - self.ewma
+            increment = self.alpha * diff
+            self.ewma += increment
+            self.ew_variance = (1 - self.alpha) * (self.ew_variance + diff * increment)
+
+        if interval < self.min:
+            self.min = interval
+        if interval > self.max:
+            self.max = interval
+
+        if interval < MIN_INTERVAL:
+            self._zero += 1
+        else:
+            index = math.ceil(math.log(interval) / self._log_gamma)
+            self._buckets[index] = self._buckets.get(index, 0) + 1
+
+    @property
+    def samples(self):
+        """Timestamps recorded."""
+        return 0 if self.last is None else self.count + 1
+
+    @property
+    def variance(self):
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def stddev(self):
+        return math.sqrt(self.variance)
+
+    @property
+    def jitter(self):
+        return math.sqrt(self.ew_variance)
+
+    def baseline(self, min_samples=20):
+        """The recent mean interval in seconds, once there are min_samples timestamps."""
+        if self.samples < min_samples or not self.count:
+            return None
+        return self.ewma
+
+    def average_with_gap(self, now):
+        """The recent mean interval if the current silence ended now, e.g. for the age column."""
+        gap = now - self.last
+        return self.ewma + self.alpha * (gap - self.ewma)
+
+    def quantile(self, fraction):
+        """Approximate interval at fraction (0..1) of all intervals, or None before the first."""
+        if not self.count:
+            return None
+        rank = fraction * (self.count - 1)
+        seen = self._zero
+        if rank < seen:
+            return 0.0
+        for index in sorted(self._buckets):
+            seen += self._buckets[index]
+            if seen > rank:
+                # The bucket covers (gamma^(index-1), gamma^index]
+                estimate = 2 * self._gamma ** index / (self._gamma + 1)
+                return min(max(estimate, self.min), self.max)
+        return self.max
+
+    def summary(self):
+        """The statistics in milliseconds, rounded for display and logs."""
+        if not self.count:
+            return {"samples": self.samples}
+
+        def ms(seconds):
+            return round(seconds * 1000, 2)
+
+        return {
+            "samples": self.samples,
+            "mean_ms": ms(self.mean),
+            "stddev_ms": ms(self.stddev),
+            "ewma_ms": ms(self.ewma),
+            "jitter_ms": ms(self.jitter),
+            "min_ms": ms(self.min),
+            "max_ms": ms(self.max),
+            "p50_ms": ms(self.quantile(0.50)),
+            "p95_ms": ms(self.quantile(0.95)),
+            "p99_ms": ms(self.quantile(0.99)),
+        }
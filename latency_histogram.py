@@ -0,0 +1,60 @@
+"""
+Fixed-size latency histogram.
+"""
+from bisect import bisect_left
+
+DEFAULT_BOUNDS_MS = (0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+class LatencyHistogram:
+    """
+    Counts latencies into log-spaced buckets, so recording is O(1) and the
+    memory use does not grow. Percentiles are reported as the upper bound of
+    the bucket they fall in (the exact maximum for the overflow bucket).
+    """
+
+    def __init__(self, bounds_ms=DEFAULT_BOUNDS_MS):
+        self.bounds_ms = tuple(bounds_ms)
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * (len(self.bounds_ms) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, seconds):
+        ms = seconds * 1000
+        self.counts[bisect_left(self.bounds_ms, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def percentile(self, fraction):
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank and bucket_count:
+                if index < len(self.bounds_ms):
+                    return round(min(self.bounds_ms[index], self.max_ms), 3)
+                break
+        return round(self.max_ms, 3)
+
+    def summary(self):
+        if not self.count:
+            return {"count": 0}
+        buckets = {f"<={bound}ms": count for bound, count in zip(self.bounds_ms, self.counts)}
+        buckets[f">{self.bounds_ms[-1]}ms"] = self.counts[-1]
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total_ms / self.count, 3),
+            "p50_ms": self.percentile(0.50),
+            "p90_ms": self.percentile(0.90),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": round(self.max_ms, 3),
+            "buckets": buckets,
+        }
@@ -0,0 +1,106 @@
+"""
+Line framing and parsing for the Arduino ``key:value`` text protocol.
+"""
+import sys
+
+from value_types import parse_value
+
+
+class KeyValueParser:
+    """
+    Incremental parser for a stream of ``key:value`` lines.
+
+    Each received chunk is joined to the unparsed tail of the previous one and
+    framed with a single ``split``, so the per-line work happens in C. Sensor
+    sketches repeat the same lines over and over, so every parsed line is
+    cached by its raw bytes: a repeated line costs one dict lookup and returns
+    the exact key and value it produced last time. Only a line that has not
+    been seen before is partitioned and decoded, its value parsed into a
+    bool, int or float where it is one (see value_types.parse_value), and its
+    key interned so every value of a channel shares one key string.
+    """
+
+    def __init__(self, control_keys=("name",), max_line_length=1024, max_cached_lines=8192):
+        self.control_keys = frozenset(key.lower() for key in control_keys)
+        self.halt_keys = frozenset()
+        self.max_line_length = max_line_length
+        self.max_cached_lines = max_cached_lines
+        self.lines_parsed = 0
+
+        self._pending = b""
+        self._keys = {}   # raw key bytes -> interned key string
+        self._lines = {}  # raw line bytes -> (key, value)
+
+    def feed(self, data, timestamp=None):
+        """
+        Append received bytes and parse every complete line.
+
+        Returns (records, controls): records is a list of (key, value,
+        timestamp) tuples for data lines, with typed values, controls a list
+        of (key, value) tuples for control lines such as ``NAME:``, with the
+        key lower-cased and the value left as text.
+        Parsing stops right after a control line whose key is in
+        ``halt_keys``; the unparsed bytes are then available from detach().
+        """
+        lines = (self._pending + data).split(b"\n")
+        pending = lines.pop()
+        if len(pending) > self.max_line_length:
+            # A line this long is noise (wrong baud rate, boot garbage); drop it
+            pending = b""
+
+        records = []
+        controls = []
+        append = records.append
+        cache = self._lines
+
+        for index, line in enumerate(lines):
+            hit = cache.get(line)
+            if hit is not None:
+                append((hit[0], hit[1], timestamp))
+                continue
+
+            raw_key, sep, raw_value = line.partition(b":")
+            if not sep:
+                continue
+
+            key = self._keys.get(raw_key)
+            if key is None:
+                key = self._intern_key(raw_key)
+            value = raw_value.decode('utf-8', errors='replace').strip()
+
+            lowered = key.lower()
+            if lowered in self.control_keys:
+                controls.append((lowered, value))
+                if lowered in self.halt_keys:
+                    lines[:index + 1] = []
+                    lines.append(pending)
+                    pending = b"\n".join(lines)
+                    break
+                continue
+
+            value = parse_value(value)
+            if len(cache) >= self.max_cached_lines:
+                cache.clear()
+            cache[line] = (key, value)
+            append((key, value, timestamp))
+
+        self._pending = pending
+        self.lines_parsed += len(records) + len(controls)
+        return records, controls
+
+    def _intern_key(self, raw_key):
+        if len(self._keys) >= self.max_cached_lines:
+            self._keys.clear()
+        key = sys.intern(raw_key.decode('utf-8', errors='replace').strip())
+        self._keys[raw_key] = key
+        return key
+
+    def detach(self):
+        """Return and clear any bytes that have not been parsed yet."""
+        remaining = self._pending
+        self._pending = b""
+        return remaining
+
+    def reset_values(self):
+        """Forget every cached line so the next value of each key is decoded afresh."""
+        self._lines.clear()
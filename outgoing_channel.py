@@ -0,0 +1,70 @@
+"""
+Delivery of posted values from the server to the GUI process.
+
+The server appends every accepted POST to an OutgoingChannel, which writes
+it to a pipe together with its monotonic arrival time. A thread in the GUI
+process blocks on the other end of the pipe, so it wakes up as soon as a
+post arrives instead of on the next timer tick.
+"""
+import multiprocessing
+import threading
+import time
+
+
+class AtomicUpdate(dict):
+    """
+    Posted values to be written to the board together and in this order,
+    or not at all. Goes through the channel like any posted dict.
+    """
+
+
+class OutgoingChannel:
+    """
+    One-way pipe of posted dicts. append() may be called from any thread of
+    the server process (or of the GUI process); receive() belongs to a single
+    consumer thread.
+    """
+
+    def __init__(self):
+        self._reader, self._writer = multiprocessing.Pipe(duplex=False)
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Processes started with spawn get their own lock
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def append(self, data):
+        """Queue one posted dict, stamped with the time it arrived."""
+        with self._lock:
+            self._writer.send((time.monotonic(), data))
+
+    def wake(self):
+        """Make a blocked receive() return, e.g. so its thread can exit."""
+        with self._lock:
+            self._writer.send(None)
+
+    def receive(self, timeout=None):
+        """
+        Block until something is posted (or timeout seconds pass) and return
+        everything waiting as a list of (posted_at, data).
+        """
+        reader = self._reader
+        if not reader.poll(timeout):
+            return []
+        items = []
+        while True:
+            item = reader.recv()
+            if item is not None:
+                items.append(item)
+            if not reader.poll():
+                return items
+
+    def close(self):
+        self._writer.close()
+        self._reader.close()
@@ -0,0 +1,45 @@
+"""
+The GET / body for the server, reused until the data version changes.
+
+The GUI already publishes the body as compact JSON, byte for byte what
+jsonify() would return, so there is nothing left to serialize here. The
+cache saves copying it out of shared memory on every poll, gzips it once
+per version for clients that accept that, and names every variant with a
+strong ETag so a client polling with If-None-Match gets a 304 instead.
+"""
+import gzip
+
+
+class ResponseCache:
+    """
+    Safe to share between request threads: an entry is replaced as a whole
+    and at worst two threads build the same one.
+    """
+
+    def __init__(self, snapshot, min_gzip_size=256, compress_level=6):
+        self.snapshot = snapshot
+        self.min_gzip_size = min_gzip_size
+        self.compress_level = compress_level
+        self._entry = [None, b"", None]  # version, body, gzipped body
+
+    def _current(self):
+        entry = self._entry
+        if entry[0] != self.snapshot.version:
+            version, body = self.snapshot.read()
+            entry = self._entry = [version, body, None]
+        return entry
+
+    def get(self, accept_gzip=False):
+        """
+        Return (etag, body, content_encoding) for the latest values; body is
+        empty before the first publish. Small bodies are never gzipped.
+        """
+        version, body, gzipped = entry = self._current()
+        # The block name tells apart snapshots that reuse version numbers
+        etag = f"{self.snapshot.name}-{version}"
+        if not accept_gzip or len(body) < self.min_gzip_size:
+            return etag, body, None
+        if gzipped is None:
+            # mtime=0 keeps the bytes, and so the ETag, stable
+            gzipped = entry[2] = gzip.compress(body, self.compress_level, mtime=0)
+        return etag + "-gzip", gzipped, "gzip"
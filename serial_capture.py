@@ -0,0 +1,259 @@
+"""
+Recording and replaying raw serial sessions.
+
+A capture file starts with a 20-byte header::
+
+    b"ARDCAP" version(u8) reserved(u8) started_at(f64, wall clock) baud_rate(u32)
+
+followed by one record per chunk, each with a 7-byte header::
+
+    direction(u8) delta_us(u32) length(u16) data[length]
+
+direction is 0 for bytes read from the board and 1 for bytes written to it.
+delta_us is the monotonic time since the previous record in microseconds.
+Longer gaps are written as empty records and bigger chunks are split, so
+the fields never overflow. All integers are little-endian.
+
+CaptureWriter appends records through a buffered file. CapturedConnection
+wraps an open serial connection so every read and write is recorded.
+ReplaySerial stands in for serial.Serial and plays the received bytes of a
+capture back: in real time, N times faster, or as fast as they are read.
+
+Run ``python serial_capture.py FILE`` for a summary of a capture.
+"""
+import argparse
+import logging
+import struct
+import threading
+import time
+
+MAGIC = b"ARDCAP"
+VERSION = 1
+
+DIRECTION_RX = 0
+DIRECTION_TX = 1
+
+FILE_HEADER = struct.Struct("<6sBBdI")
+RECORD_HEADER = struct.Struct("<BIH")
+MAX_DELTA_US = 0xFFFFFFFF
+MAX_CHUNK = 0xFFFF
+
+
+# --------------------------------------------------------------------
+# Recording
+# --------------------------------------------------------------------
+class CaptureWriter:
+    """Append timestamped chunks to a capture file. Safe to use from several threads."""
+
+    def __init__(self, path, baud_rate=0, buffer_size=64 * 1024):
+        self.path = path
+        self.chunks = 0
+        self.bytes = 0
+        self._file = open(path, "wb", buffering=buffer_size)
+        self._file.write(FILE_HEADER.pack(MAGIC, VERSION, 0, time.time(), baud_rate))
+        self._started = time.monotonic()
+        self._last_us = 0
+        self._lock = threading.Lock()
+
+    def record(self, direction, data, now=None):
+        if not data:
+            # Nothing to replay; the gap belongs to the next chunk's delta
+            return
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if self._file is None:
+                return
+            at_us = max(self._last_us, int((now - self._started) * 1_000_000))
+            delta = at_us - self._last_us
+            self._last_us = at_us
+
+            write = self._file.write
+            while delta > MAX_DELTA_US:
+                write(RECORD_HEADER.pack(direction, MAX_DELTA_US, 0))
+                delta -= MAX_DELTA_US
+            for start in range(0, len(data), MAX_CHUNK):
+                piece = data[start:start + MAX_CHUNK]
+                write(RECORD_HEADER.pack(direction, delta, len(piece)))
+                write(piece)
+                delta = 0
+            self.chunks += 1
+            self.bytes += len(data)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class CapturedConnection:
+    """An open serial connection that records everything read from and written to it."""
+
+    def __init__(self, connection, capture):
+        self._connection = connection
+        self._capture = capture
+
+    def read(self, size=1):
+        data = self._connection.read(size)
+        if data:
+            self._capture.record(DIRECTION_RX, data)
+        return data
+
+    def write(self, data):
+        written = self._connection.write(data)
+        self._capture.record(DIRECTION_TX, data)
+        return written
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+# --------------------------------------------------------------------
+# Reading
+# --------------------------------------------------------------------
+class CaptureReader:
+    """Iterate over the (offset_seconds, direction, data) records of a capture file."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            header = f.read(FILE_HEADER.size)
+        if len(header) < FILE_HEADER.size:
+            raise ValueError(f"{path} is not a serial capture")
+        magic, version, _, self.started_at, self.baud_rate = FILE_HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} serial capture")
+
+    def __iter__(self):
+        header_size = RECORD_HEADER.size
+        at_us = 0
+        with open(self.path, "rb") as f:
+            f.seek(FILE_HEADER.size)
+            while True:
+                header = f.read(header_size)
+                if len(header) < header_size:
+                    return
+                direction, delta, length = RECORD_HEADER.unpack(header)
+                data = f.read(length)
+                if len(data) < length:
+                    # Truncated by a crash while recording; keep what is complete
+                    return
+                at_us += delta
+                if data:
+                    yield at_us / 1_000_000, direction, data
+
+
+class ReplaySerial:
+    """
+    Read-only stand-in for serial.Serial that plays back the bytes a capture
+    received from the board. speed is a multiple of real time; 0 replays as
+    fast as the reader asks, one recorded chunk per read. Writes are counted
+    and dropped. Once the capture is exhausted reads time out like a quiet
+    board and finished is set.
+    """
+
+    def __init__(self, port, baudrate=9600, timeout=None, speed=1.0):
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.speed = speed
+        self.finished = False
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.is_open = True
+
+        self._records = ((offset, data) for offset, direction, data in CaptureReader(port)
+                         if direction == DIRECTION_RX)
+        self._next = next(self._records, None)
+        self._buffer = bytearray()
+        self._cancel = threading.Event()
+        self._started = time.monotonic()
+
+    def _release(self, now):
+        """Move every chunk that is due by now into the read buffer."""
+        if self.speed <= 0:
+            if not self._buffer and self._next is not None:
+                self._buffer += self._next[1]
+                self._next = next(self._records, None)
+            return
+        while self._next is not None and self._started + self._next[0] / self.speed <= now:
+            self._buffer += self._next[1]
+            self._next = next(self._records, None)
+
+    @property
+    def in_waiting(self):
+        self._release(time.monotonic())
+        return len(self._buffer)
+
+    def read(self, size=1):
+        now = time.monotonic()
+        deadline = None if self.timeout is None else now + self.timeout
+        while True:
+            self._release(now)
+            if self._buffer:
+                data = bytes(self._buffer[:size])
+                del self._buffer[:size]
+                self.bytes_read += len(data)
+                return data
+
+            if self._next is None:
+                if not self.finished:
+                    self.finished = True
+                    logging.info(f"Replay of {self.port} finished ({self.bytes_read} bytes).")
+                wait = self.timeout
+            else:
+                wait = self._started + self._next[0] / self.speed - now
+                if deadline is not None:
+                    wait = min(wait, deadline - now)
+            if deadline is not None and now >= deadline:
+                return b""
+            if self._cancel.wait(wait):
+                self._cancel.clear()
+                return b""
+            now = time.monotonic()
+            if self._next is None:
+                return b""
+
+    def write(self, data):
+        self.bytes_written += len(data)
+        return len(data)
+
+    def cancel_read(self):
+        self._cancel.set()
+
+    def close(self):
+        self.is_open = False
+        self._records.close()
+
+
+# --------------------------------------------------------------------
+# Command line
+# --------------------------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Summarise a serial capture file.")
+    parser.add_argument("path", help="capture file")
+    args = parser.parse_args()
+
+    capture = CaptureReader(args.path)
+    counts = {DIRECTION_RX: [0, 0], DIRECTION_TX: [0, 0]}
+    duration = 0.0
+    for offset, direction, data in capture:
+        counts[direction][0] += 1
+        counts[direction][1] += len(data)
+        duration = offset
+
+    print(f"Recorded:  {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(capture.started_at))}")
+    print(f"Baud rate: {capture.baud_rate}")
+    print(f"Duration:  {duration:.3f} s")
+    print(f"Received:  {counts[DIRECTION_RX][1]} bytes in {counts[DIRECTION_RX][0]} chunks")
+    print(f"Sent:      {counts[DIRECTION_TX][1]} bytes in {counts[DIRECTION_TX][0]} chunks")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+"""
+Current Arduino values shared between the GUI and the server process.
+
+The GUI process is the only writer. It keeps the values in a plain dict and
+publishes the JSON body the server returns for GET / into a shared memory
+block after every change. The server copies the latest body out of shared
+memory without any IPC call or lock.
+
+The block holds two slots behind a small header. A write always goes to
+the slot readers are not pointed at; readers check the slot's sequence
+number before and after copying (a seqlock) and retry if a writer touched
+it meanwhile, which can only happen if two writes finish during one copy.
+
+    header: version(u64) active_slot(u32) capacity(u32)
+    slot:   sequence(u64) version(u64) length(u32) pad(u32) body[capacity]
+"""
+import json
+import logging
+import struct
+import time
+from multiprocessing import shared_memory
+
+from value_types import json_safe
+
+HEADER = struct.Struct("<QII")
+SLOT_HEADER = struct.Struct("<QQII")
+SLOT_CONTENT = struct.Struct("<QI")  # version and length, after the sequence
+U64 = struct.Struct("<Q")
+U32 = struct.Struct("<I")
+
+DEFAULT_CAPACITY = 1 << 20  # bytes of JSON per slot
+
+
+class SharedSnapshot:
+    """
+    A double-buffered seqlock around one bytes value in shared memory.
+    Create one with no name in the writer process; pass it (or its name) to
+    the reader, which attaches to the same block.
+    """
+
+    def __init__(self, name=None, capacity=DEFAULT_CAPACITY):
+        if name is None:
+            size = HEADER.size + 2 * (SLOT_HEADER.size + capacity)
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+            self._shm.buf[:size] = bytes(size)
+            HEADER.pack_into(self._shm.buf, 0, 0, 0, capacity)
+            self.owner = True
+        else:
+            try:
+                self._shm = shared_memory.SharedMemory(name=name, track=False)
+            except TypeError:
+                # Before Python 3.13. The server process shares the creator's
+                # resource tracker, so registering the block again is harmless
+                self._shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.name = self._shm.name
+        self.capacity = HEADER.unpack_from(self._shm.buf, 0)[2]
+        self.retries = 0
+
+    def __reduce__(self):
+        # Processes started with spawn attach by name instead of copying
+        return SharedSnapshot, (self.name,)
+
+    def _slot_offset(self, slot):
+        return HEADER.size + slot * (SLOT_HEADER.size + self.capacity)
+
+    def write(self, body):
+        """Publish a new value. Only one process may write. Returns False if body is too large."""
+        if len(body) > self.capacity:
+            logging.error(f"Snapshot of {len(body)} bytes exceeds the {self.capacity} byte capacity; not published.")
+            return False
+        buf = self._shm.buf
+        version, active, _ = HEADER.unpack_from(buf, 0)
+        slot = 1 - active
+        offset = self._slot_offset(slot)
+        sequence = U64.unpack_from(buf, offset)[0]
+
+        U64.pack_into(buf, offset, sequence + 1)  # odd: slot is being written
+        version += 1
+        SLOT_CONTENT.pack_into(buf, offset + U64.size, version, len(body))
+        start = offset + SLOT_HEADER.size
+        buf[start:start + len(body)] = body
+        U64.pack_into(buf, offset, sequence + 2)
+
+        U64.pack_into(buf, 0, version)
+        U32.pack_into(buf, U64.size, slot)
+        return True
+
+    def read(self):
+        """Return (version, body) of the latest complete write; version is 0 before the first one."""
+        buf = self._shm.buf
+        attempt = 0
+        while True:
+            active = U32.unpack_from(buf, U64.size)[0]
+            offset = self._slot_offset(active)
+            sequence, version, length, _ = SLOT_HEADER.unpack_from(buf, offset)
+            if not sequence & 1:
+                start = offset + SLOT_HEADER.size
+                body = bytes(buf[start:start + length])
+                if U64.unpack_from(buf, offset)[0] == sequence:
+                    return version, body
+            attempt += 1
+            self.retries += 1
+            # The writer is mid-copy; let it finish
+            time.sleep(0 if attempt < 100 else 0.0001)
+
+    @property
+    def version(self):
+        return U64.unpack_from(self._shm.buf, 0)[0]
+
+    def close(self):
+        self._shm.close()
+
+    def unlink(self):
+        """Close and free the block. Only the creating process should call this."""
+        self._shm.close()
+        if self.owner:
+            self._shm.unlink()
+
+
+def encode_values(values):
+    """The GET / body for a dict of values, byte for byte what jsonify() returns (but with NaN as null)."""
+    if not values:
+        return b""
+    values = {key: json_safe(value) for key, value in values.items()}
+    return (json.dumps(values, sort_keys=True, separators=(",", ":")) + "\n").encode('utf-8')
+
+
+def encode_item(key, value):
+    return f"{json.dumps(key)}:{json.dumps(json_safe(value))}".encode('utf-8')
+
+
+class SnapshotStore:
+    """
+    The writer side used by ArduinoApp in place of a Manager dict: keeps the
+    current values locally and republishes the snapshot on every change.
+
+    Each key's ``"key":value`` JSON is cached, so a publish only encodes the
+    keys that changed and joins the rest in sorted order. The result matches
+    encode_values() for the same dict.
+    """
+
+    def __init__(self, snapshot=None):
+        self.snapshot = snapshot or SharedSnapshot()
+        self.values = {}
+        self._items = {}          # key -> encoded "key":value
+        self._sorted_keys = []    # rebuilt only when a key is added
+
+    def update(self, changed):
+        items = self._items
+        added = False
+        for key, value in changed.items():
+            if key not in items:
+                added = True
+            items[key] = encode_item(key, value)
+        self.values.update(changed)
+        if added:
+            self._sorted_keys = sorted(items)
+        self.publish()
+
+    def __setitem__(self, key, value):
+        self.update({key: value})
+
+    def remove(self, keys):
+        for key in keys:
+            self.values.pop(key, None)
+            self._items.pop(key, None)
+        self._sorted_keys = sorted(self._items)
+        self.publish()
+
+    def clear(self):
+        self.values.clear()
+        self._items.clear()
+        self._sorted_keys = []
+        self.publish()
+
+    def publish(self):
+        if not self._items:
+            self.snapshot.write(b"")
+            return
+        body = b"{" + b",".join(map(self._items.__getitem__, self._sorted_keys)) + b"}\n"
+        self.snapshot.write(body)
+
+    def __getitem__(self, key):
+        return self.values[key]
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    def __contains__(self, key):
+        return key in self.values
+
+    def __len__(self):
+        return len(self.values)
+
+    def close(self):
+        self.snapshot.unlink()
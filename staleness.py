@@ -0,0 +1,189 @@
+"""
+Staleness of every channel, checked against per-channel rules.
+
+A channel is stale when any of its rules fires:
+
+* timeout: no sample for more than this many seconds
+* relative: the recent average interval, counting the current silence as
+  an interval, is more than this fraction above the baseline (the rule
+  the table always used, with 0.10)
+* rate_floor: that same average interval says fewer than this many
+  samples per second
+
+Given a channel's last timestamp and interval statistics, each rule comes
+down to how long the current silence may last, so the engine works out
+one deadline per channel whenever a sample arrives or its rules change.
+Deadlines, timestamps and rule parameters sit in contiguous arrays indexed
+by channel, and evaluate() checks all deadlines in one pass over the
+array (a min() first, which is all it takes when nothing is due). A stale
+channel's deadline is infinite until its next sample, so the pass only
+finds channels that just went stale, and evaluate() returns only channels
+whose state changed.
+"""
+import math
+from array import array
+
+INF = math.inf
+
+FRESH = 0
+STALE = 1
+
+REASONS = ("", "timeout", "relative", "rate_floor")
+REASON_TIMEOUT = 1
+REASON_RELATIVE = 2
+REASON_RATE_FLOOR = 3
+
+_DEFAULT = object()
+
+
+def _rule_value(value):
+    return INF if value is None else float(value)
+
+
+class StalenessEngine:
+    """
+    timeout, relative and rate_floor are the rules for channels without
+    their own (None turns a rule off). min_samples is how many timestamps a
+    channel needs before its baseline counts, as in IntervalStats.baseline().
+    """
+
+    def __init__(self, timeout=None, relative=0.10, rate_floor=None, min_samples=20):
+        self.default_rules = (timeout, relative, rate_floor)
+        self.min_samples = min_samples
+        self._rules = {}  # key -> (timeout, relative, rate_floor), set before the key was seen
+        self.clear()
+
+    def clear(self):
+        self.keys = []
+        self.index = {}
+        self.stats = []
+        self.last_seen = array('d')
+        self.deadline = array('d')  # INF while stale or without rules that apply
+        self.timeout = array('d')
+        self.relative = array('d')
+        self.floor_interval = array('d')  # 1 / rate_floor
+        self.state = bytearray()
+        self.reported = bytearray()  # state as of the last evaluate()
+        self.reason = bytearray()  # rule the deadline comes from
+        self.since = array('d')    # when the state last changed
+        self._changes = []
+
+    def __len__(self):
+        return len(self.keys)
+
+    # ----------------------------------------------------------------
+    # Rules
+    # ----------------------------------------------------------------
+    def configure(self, key, timeout=_DEFAULT, relative=_DEFAULT, rate_floor=_DEFAULT):
+        """Set a channel's rules; arguments left out keep their current value."""
+        current = self._current_rules(key)
+        rules = tuple(current[i] if value is _DEFAULT else value
+                      for i, value in enumerate((timeout, relative, rate_floor)))
+        self._rules[key] = rules
+        i = self.index.get(key)
+        if i is not None:
+            self._set_rules(i, rules)
+            self._schedule(i)
+
+    def _current_rules(self, key):
+        return self._rules.get(key, self.default_rules)
+
+    def _set_rules(self, i, rules):
+        timeout, relative, rate_floor = rules
+        self.timeout[i] = _rule_value(timeout)
+        self.relative[i] = _rule_value(relative)
+        self.floor_interval[i] = INF if not rate_floor else 1 / rate_floor
+
+    # ----------------------------------------------------------------
+    # Samples
+    # ----------------------------------------------------------------
+    def seen(self, key, stats):
+        """Note a sample for key; stats is its IntervalStats, already updated."""
+        i = self.index.get(key)
+        if i is None:
+            i = self._add(key, stats)
+        self.last_seen[i] = stats.last
+        if self.state[i] == STALE:
+            self.state[i] = FRESH
+            self.since[i] = stats.last
+            self._changes.append(i)
+        self._schedule(i)
+
+    def _add(self, key, stats):
+        i = len(self.keys)
+        self.keys.append(key)
+        self.index[key] = i
+        self.stats.append(stats)
+        for column in (self.last_seen, self.timeout, self.relative, self.floor_interval, self.since):
+            column.append(0.0)
+        self.deadline.append(INF)
+        self.state.append(FRESH)
+        self.reported.append(FRESH)
+        self.reason.append(0)
+        self._set_rules(i, self._current_rules(key))
+        return i
+
+    def _schedule(self, i):
+        """Work out when channel i goes stale if nothing arrives."""
+        stats = self.stats[i]
+        gap = self.timeout[i]
+        reason = REASON_TIMEOUT
+        if stats.count:
+            ewma = stats.ewma
+            alpha = stats.alpha
+            # average_with_gap() passes limit once the gap exceeds this
+            if self.relative[i] != INF and stats.samples >= self.min_samples:
+                limit_gap = (ewma * (1 + self.relative[i]) - ewma * (1 - alpha)) / alpha
+                if limit_gap < gap:
+                    gap, reason = limit_gap, REASON_RELATIVE
+            if self.floor_interval[i] != INF:
+                limit_gap = (self.floor_interval[i] - ewma * (1 - alpha)) / alpha
+                if limit_gap < gap:
+                    gap, reason = limit_gap, REASON_RATE_FLOOR
+
+        self.reason[i] = reason
+        if self.state[i] == FRESH:
+            self.deadline[i] = self.last_seen[i] + max(gap, 0.0)
+
+    # ----------------------------------------------------------------
+    # Evaluation
+    # ----------------------------------------------------------------
+    def evaluate(self, now):
+        """
+        Return [(key, stale, reason)] for every channel whose state changed
+        since the last call: channels that went stale by now, and stale
+        channels that got a sample since.
+        """
+        deadline = self.deadline
+        state = self.state
+        changed = self._changes
+        if deadline and min(deadline) <= now:
+            for i in [i for i, at in enumerate(deadline) if at <= now]:
+                state[i] = STALE
+                deadline[i] = INF
+                self.since[i] = now
+                changed.append(i)
+
+        self._changes = []
+        keys = self.keys
+        reported = self.reported
+        result = []
+        for i in changed:
+            # Skips channels that flipped back, and duplicates
+            if state[i] != reported[i]:
+                reported[i] = state[i]
+                stale = state[i] == STALE
+                result.append((keys[i], stale, REASONS[self.reason[i]] if stale else ""))
+        return result
+
+    def is_stale(self, key):
+        i = self.index.get(key)
+        return i is not None and self.state[i] == STALE
+
+    def status(self, key):
+        """(stale, reason, since) for key, or None if it was never seen."""
+        i = self.index.get(key)
+        if i is None:
+            return None
+        stale = self.state[i] == STALE
+        return stale, REASONS[self.reason[i]] if stale else "", self.since[i]
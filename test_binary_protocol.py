@@ -0,0 +1,101 @@
+import pytest
+
+from binary_protocol import (TYPE_FLOAT32, TYPE_INT16, TYPE_INT32, BinaryDecoder, cobs_decode, cobs_encode,
+                             crc16, encode_channel_definition, encode_samples)
+
+CHANNEL_TYPES = {1: TYPE_INT16, 2: TYPE_INT32, 3: TYPE_FLOAT32}
+
+
+@pytest.mark.parametrize("data", [
+    b"",
+    b"\x00",
+    b"\x00\x00",
+    b"\x11\x22\x00\x33",
+    b"\x11\x00",
+    bytes(range(1, 254)),
+    bytes(range(1, 255)),
+    bytes(range(1, 256)),
+    bytes(range(256)) * 3,
+    b"\xff" * 254 + b"\x00",
+])
+def test_cobs_round_trip(data):
+    encoded = cobs_encode(data)
+    assert b"\x00" not in encoded
+    assert cobs_decode(encoded) == data
+
+
+@pytest.mark.parametrize("encoded", [b"\x00\x01", b"\x05\x11\x22", b"\x02\x11\x00"])
+def test_cobs_rejects_malformed_packets(encoded):
+    with pytest.raises(ValueError):
+        cobs_decode(encoded)
+
+
+def test_crc16_is_ccitt_false():
+    assert crc16(b"123456789") == 0x29B1
+    assert crc16(b"") == 0xFFFF
+
+
+def make_decoder():
+    decoder = BinaryDecoder()
+    definitions = (encode_channel_definition(1, TYPE_INT16, "temp")
+                   + encode_channel_definition(2, TYPE_INT32, "count")
+                   + encode_channel_definition(3, TYPE_FLOAT32, "volts"))
+    assert decoder.feed(definitions) == []
+    return decoder
+
+
+def test_samples_round_trip_in_any_chunking():
+    stream = (encode_samples([(1, -5), (2, 70000)], CHANNEL_TYPES)
+              + encode_samples([(3, 0.1)], CHANNEL_TYPES))
+    expected = [("temp", -5, 7), ("count", 70000, 7), ("volts", 0.1, 7)]
+    for size in (1, 2, 3, len(stream)):
+        decoder = make_decoder()
+        records = []
+        for start in range(0, len(stream), size):
+            records += decoder.feed(stream[start:start + size], 7)
+        assert records == expected
+        assert decoder.crc_errors == 0
+
+
+def corrupt(packet, index):
+    data = bytearray(packet)
+    data[index] ^= 0x40
+    return bytes(data)
+
+
+def test_resyncs_after_a_corrupted_byte():
+    decoder = make_decoder()
+    good = encode_samples([(1, 42)], CHANNEL_TYPES)
+    bad = encode_samples([(1, 43)], CHANNEL_TYPES)
+    for index in range(len(bad) - 1):
+        records = decoder.feed(corrupt(bad, index) + good)
+        assert records[-1:] == [("temp", 42, None)]
+        assert ("temp", 43, None) not in records
+    assert decoder.crc_errors == len(bad) - 1
+
+
+def test_resyncs_after_a_dropped_byte():
+    decoder = make_decoder()
+    good = encode_samples([(1, 42)], CHANNEL_TYPES)
+    bad = encode_samples([(2, 123456)], CHANNEL_TYPES)
+    for index in range(len(bad) - 1):
+        records = decoder.feed(bad[:index] + bad[index + 1:] + good)
+        assert records == [("temp", 42, None)]
+    assert decoder.crc_errors == len(bad) - 1
+
+
+def test_a_dropped_terminator_loses_only_the_packets_it_joins():
+    decoder = make_decoder()
+    first = encode_samples([(1, 1)], CHANNEL_TYPES)
+    second = encode_samples([(1, 2)], CHANNEL_TYPES)
+    third = encode_samples([(1, 3)], CHANNEL_TYPES)
+    assert decoder.feed(first[:-1] + second + third) == [("temp", 3, None)]
+    assert decoder.crc_errors == 1
+
+
+def test_garbage_longer_than_a_packet_is_dropped():
+    decoder = BinaryDecoder(max_packet_length=16)
+    decoder.feed(b"\x01" * 100)
+    assert decoder._pending == b""
+    assert decoder.feed(encode_channel_definition(1, TYPE_INT16, "temp")
+                        + encode_samples([(1, 9)], CHANNEL_TYPES)) == [("temp", 9, None)]
@@ -0,0 +1,19 @@
+from serial_capture import DIRECTION_RX, DIRECTION_TX, CaptureReader, CaptureWriter
+
+
+def test_empty_reads_keep_the_time_of_the_next_chunk(tmp_path):
+    path = tmp_path / "session.cap"
+    with CaptureWriter(path) as capture:
+        start = capture._started
+        capture.record(DIRECTION_RX, b"a:1\n", start + 0.5)
+        capture.record(DIRECTION_RX, b"", start + 1.0)
+        capture.record(DIRECTION_TX, b"b:2\n", start + 1.5)
+        capture.record(DIRECTION_RX, b"", start + 2.0)
+        capture.record(DIRECTION_RX, b"a:3\n", start + 3.0)
+
+    assert list(CaptureReader(path)) == [
+        (0.5, DIRECTION_RX, b"a:1\n"),
+        (1.5, DIRECTION_TX, b"b:2\n"),
+        (3.0, DIRECTION_RX, b"a:3\n"),
+    ]
+    assert capture.chunks == 3
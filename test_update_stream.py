@@ -0,0 +1,30 @@
+from shared_snapshot import SnapshotStore
+from update_stream import Subscriber, UpdateHub
+
+
+def test_new_key_with_null_value_is_published():
+    store = SnapshotStore()
+    hub = UpdateHub(store.snapshot)
+    try:
+        store.update({"a": None, "b": 1})
+        _, values, _, full = hub.changes_since(0)
+        assert full
+        assert values == {"a": None, "b": 1}
+
+        version, _, _, _ = hub.changes_since(0)
+        store.update({"c": float("nan")})
+        _, values, _, full = hub.changes_since(version)
+        assert not full
+        assert values == {"c": None}
+    finally:
+        hub.close()
+        store.close()
+
+
+def test_get_without_pending_updates_returns_none():
+    subscriber = Subscriber()
+    subscriber.push({"temp": 21})
+    assert subscriber.get(0) == {"temp": 21}
+    # A wake-up with nothing pending isn't an empty update
+    subscriber._ready.set()
+    assert subscriber.get(0) is None
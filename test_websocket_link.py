@@ -0,0 +1,121 @@
+import socket
+import struct
+import threading
+
+import pytest
+
+from websocket_link import (CLOSE_INVALID_DATA, CLOSE_NORMAL, CLOSE_TOO_BIG, OP_BINARY, OP_CLOSE,
+                            OP_CONTINUATION, OP_PING, OP_TEXT, WebSocket, encode_frame)
+
+
+def tcp_pair():
+    # socket.socketpair() is AF_UNIX here, which has no TCP_NODELAY
+    with socket.create_server(("127.0.0.1", 0)) as listener:
+        client = socket.create_connection(listener.getsockname())
+        server, _ = listener.accept()
+    for sock in (client, server):
+        sock.settimeout(5)
+    return client, server
+
+
+@pytest.fixture
+def link():
+    client_sock, server_sock = tcp_pair()
+    yield client_sock, server_sock
+    client_sock.close()
+    server_sock.close()
+
+
+def frame(opcode, payload, fin=True):
+    """A masked frame as a client sends it, optionally not final."""
+    data = bytearray(encode_frame(opcode, payload, mask=True))
+    if not fin:
+        data[0] &= 0x7F
+    return bytes(data)
+
+
+def send_in_background(sock, data):
+    # Large frames don't fit the socket buffers until the peer reads
+    sender = threading.Thread(target=sock.sendall, args=(data,))
+    sender.start()
+    return sender
+
+
+def test_masked_and_unmasked_round_trip(link):
+    client = WebSocket(link[0], client=True)
+    server = WebSocket(link[1])
+
+    assert client.send("héllo")
+    assert server.receive() == "héllo"
+    assert server.send(b"\x00\x01\xff")
+    assert client.receive() == b"\x00\x01\xff"
+
+
+def test_fragmented_message_with_ping_in_between(link):
+    client_sock, server_sock = link
+    server = WebSocket(server_sock)
+    client_sock.sendall(frame(OP_TEXT, b"hel", fin=False)
+                        + frame(OP_PING, b"?")
+                        + frame(OP_CONTINUATION, b"l", fin=False)
+                        + frame(OP_CONTINUATION, b"o"))
+
+    assert server.receive() == "hello"
+    # The ping was answered on the way, unmasked
+    assert client_sock.recv(3) == b"\x8a\x01?"
+
+
+@pytest.mark.parametrize("size, length_byte", [(125, 125), (126, 126), (65535, 126), (65536, 127)])
+def test_length_forms(link, size, length_byte):
+    client = WebSocket(link[0], client=True)
+    server = WebSocket(link[1])
+    payload = bytes(range(256)) * (size // 256) + bytes(size % 256)
+    assert encode_frame(OP_BINARY, payload)[1] == length_byte
+
+    sender = send_in_background(link[0], frame(OP_BINARY, payload))
+    assert server.receive() == payload
+    sender.join()
+    sender = send_in_background(link[1], encode_frame(OP_BINARY, payload))
+    assert client.receive() == payload
+    sender.join()
+
+
+def test_oversized_message_closes_with_1009(link):
+    client = WebSocket(link[0], client=True)
+    server = WebSocket(link[1], max_message=100)
+    link[0].sendall(frame(OP_TEXT, b"x" * 60, fin=False) + frame(OP_CONTINUATION, b"x" * 60))
+
+    assert server.receive() is None
+    assert server.close_code == CLOSE_TOO_BIG
+    assert client.receive() is None
+    assert client.close_code == CLOSE_TOO_BIG
+
+
+def test_oversized_frame_closes_before_reading_it(link):
+    server = WebSocket(link[1], max_message=100)
+    # Only the header: the length alone is enough to refuse it
+    link[0].sendall(frame(OP_BINARY, b"x" * 1000)[:8])
+
+    assert server.receive() is None
+    assert server.close_code == CLOSE_TOO_BIG
+
+
+def test_non_utf8_text_closes_with_1007(link):
+    client = WebSocket(link[0], client=True)
+    server = WebSocket(link[1])
+    link[0].sendall(frame(OP_TEXT, b"\xff\xfe"))
+
+    assert server.receive() is None
+    assert server.close_code == CLOSE_INVALID_DATA
+    assert client.receive() is None
+    assert client.close_code == CLOSE_INVALID_DATA
+
+
+def test_close_is_echoed(link):
+    client_sock, server_sock = link
+    server = WebSocket(server_sock)
+    client_sock.sendall(frame(OP_CLOSE, struct.pack("!H", CLOSE_NORMAL) + b"done"))
+
+    assert server.receive() is None
+    assert server.closed
+    assert server.close_code == CLOSE_NORMAL
+    assert client_sock.makefile("rb").read() == encode_frame(OP_CLOSE, struct.pack("!H", CLOSE_NORMAL))
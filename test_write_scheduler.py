@@ -0,0 +1,17 @@
+from write_scheduler import WriteScheduler
+
+
+def test_submit_keeps_a_grouped_key_in_its_group():
+    scheduler = WriteScheduler(baud_rate=9600)
+    scheduler.submit_group("board", [("a", "a", 1), ("b", "b", 2)])
+    scheduler.submit("board", "c", "c", 3)
+    scheduler.submit("board", "a", "a", 4)
+    assert scheduler.coalesced == 1
+
+    payload, items = scheduler.next_batch("board", now=0.0)
+    assert payload == b"a:4\nb:2\nc:3\n"
+    assert [key for key, _, _ in items] == ["a", "b", "c"]
+
+    # Room for the new a alone isn't room for its group
+    scheduler._allowance["board"] = (len(b"a:4\n"), 0.0)
+    assert scheduler.next_batch("board", now=0.0) == (b"", [])
@@ -0,0 +1,217 @@
+"""
+Per-channel history of (timestamp, value) samples.
+
+Each channel is a SeriesRing: two preallocated arrays, one of timestamps
+and one of values, used as a ring. The values array takes the channel's
+type: 'b' for bools, 'i' for ints (widened to 'q' if a value needs 64
+bits) and 'd' for floats; an int ring that gets a float is widened to 'd'.
+So a sample costs 9 bytes on a bool channel, 12 on an int channel and 16
+on a float channel however long the app runs, and appending never
+allocates. Text values are kept in a third, list-backed ring, only created
+for a channel that ever sees text, at 8 bytes per slot plus the strings.
+
+Retention is by count (capacity), by age (max_age seconds), or both. The
+capacity always bounds memory. max_age also drops samples older than that
+whenever one is appended.
+"""
+from array import array
+
+DEFAULT_CAPACITY = 1000  # samples per channel: 16 KB for a float channel
+
+TYPECODES = {bool: 'b', int: 'i', float: 'd'}
+WIDER = {'b': 'i', 'i': 'q', 'q': 'd'}
+
+
+def typecode_for(value):
+    """The array typecode a ring starts with for a channel whose first value is value."""
+    return TYPECODES.get(type(value), 'd')
+
+
+class SeriesRing:
+    """Fixed-capacity ring of (timestamp, value) samples, oldest first."""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, max_age=None, typecode='d'):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.max_age = max_age
+        self.timestamps = array('d', bytes(8 * capacity))
+        self.values = array(typecode, bytes(array(typecode).itemsize * capacity))
+        self.texts = None
+        self.start = 0  # slot of the oldest sample
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def typecode(self):
+        return self.values.typecode
+
+    @property
+    def memory_bytes(self):
+        """Bytes held by the ring itself (not counting text values)."""
+        slot = 8 + self.values.itemsize
+        if self.texts is not None:
+            slot += 8
+        return slot * self.capacity
+
+    def append(self, timestamp, value):
+        capacity = self.capacity
+        slot = self.start + self.count
+        if slot >= capacity:
+            slot -= capacity
+        self.timestamps[slot] = timestamp
+        kind = type(value)
+        if kind in TYPECODES:
+            if kind is not bool and self.values.typecode == 'b':
+                # 'b' holds small ints too, but they'd read back as bools
+                self._widen(value)
+            try:
+                self.values[slot] = value
+            except (TypeError, OverflowError):
+                self._widen(value)
+                self._store(slot, value)
+            else:
+                if self.texts is not None:
+                    self.texts[slot] = None
+        else:
+            self._store_text(slot, value)
+
+        if self.count < capacity:
+            self.count += 1
+        else:
+            self.start = self.start + 1 if self.start + 1 < capacity else 0
+        if self.max_age is not None:
+            self.expire(timestamp - self.max_age)
+
+    def _widen(self, value):
+        """Convert the values array to a typecode that holds value."""
+        typecode = self.values.typecode
+        while typecode != 'd':
+            typecode = 'd' if type(value) is float else WIDER[typecode]
+            try:
+                array(typecode, [value])
+                break
+            except (TypeError, OverflowError):
+                continue
+        self.values = array(typecode, self.values)
+
+    def _store(self, slot, value):
+        try:
+            self.values[slot] = value
+        except OverflowError:
+            # An int too big even for a float
+            self._store_text(slot, value)
+            return
+        if self.texts is not None:
+            self.texts[slot] = None
+
+    def _store_text(self, slot, value):
+        if self.texts is None:
+            self.texts = [None] * self.capacity
+        self.texts[slot] = str(value)
+
+    def expire(self, cutoff):
+        """Drop samples older than cutoff."""
+        timestamps = self.timestamps
+        while self.count and timestamps[self.start] < cutoff:
+            if self.texts is not None:
+                self.texts[self.start] = None
+            self.start = self.start + 1 if self.start + 1 < self.capacity else 0
+            self.count -= 1
+
+    def _slot(self, index):
+        slot = self.start + index
+        return slot - self.capacity if slot >= self.capacity else slot
+
+    def _value(self, slot):
+        if self.texts is not None and self.texts[slot] is not None:
+            return self.texts[slot]
+        value = self.values[slot]
+        return bool(value) if self.values.typecode == 'b' else value
+
+    def latest(self):
+        """The newest (timestamp, value), or None if empty."""
+        if not self.count:
+            return None
+        slot = self._slot(self.count - 1)
+        return self.timestamps[slot], self._value(slot)
+
+    def samples(self, since=None):
+        """(timestamp, value) pairs, oldest first, optionally only those newer than since."""
+        first = 0
+        if since is not None:
+            # Timestamps only grow, so binary search the logical order
+            low, high = 0, self.count
+            while low < high:
+                middle = (low + high) // 2
+                if self.timestamps[self._slot(middle)] <= since:
+                    low = middle + 1
+                else:
+                    high = middle
+            first = low
+        result = []
+        for index in range(first, self.count):
+            slot = self._slot(index)
+            result.append((self.timestamps[slot], self._value(slot)))
+        return result
+
+    def clear(self):
+        self.start = 0
+        self.count = 0
+        if self.texts is not None:
+            self.texts = None
+
+
+class TimeSeriesStore:
+    """
+    One SeriesRing per key, created on the first sample. capacity and
+    max_age are the defaults; configure() overrides them per key.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, max_age=None):
+        self.capacity = capacity
+        self.max_age = max_age
+        self.series = {}
+        self._retention = {}  # key -> (capacity, max_age)
+
+    def configure(self, key, capacity=None, max_age=None):
+        """Set a key's retention. An existing ring is resized, keeping its newest samples."""
+        retention = (capacity or self.capacity, max_age)
+        self._retention[key] = retention
+        old = self.series.get(key)
+        if old is not None:
+            ring = self.series[key] = SeriesRing(*retention, old.typecode)
+            for timestamp, value in old.samples():
+                ring.append(timestamp, value)
+
+    def append(self, key, value, timestamp):
+        ring = self.series.get(key)
+        if ring is None:
+            capacity, max_age = self._retention.get(key, (self.capacity, self.max_age))
+            ring = self.series[key] = SeriesRing(capacity, max_age, typecode_for(value))
+        ring.append(timestamp, value)
+
+    def get(self, key):
+        return self.series.get(key)
+
+    def samples(self, key, since=None):
+        ring = self.series.get(key)
+        return ring.samples(since) if ring is not None else []
+
+    def __contains__(self, key):
+        return key in self.series
+
+    def __len__(self):
+        return len(self.series)
+
+    def keys(self):
+        return self.series.keys()
+
+    @property
+    def memory_bytes(self):
+        return sum(ring.memory_bytes for ring in self.series.values())
+
+    def clear(self):
+        self.series.clear()
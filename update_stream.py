@@ -0,0 +1,215 @@
+"""
+Fan-out of changed values to streaming clients (the /stream endpoint).
+
+The hub lives wherever the server runs and follows the shared snapshot the
+GUI publishes. While at least one client is subscribed, a watcher thread
+checks the snapshot version every poll_interval seconds; when it moves, the
+hub diffs the new values against the last ones and hands only the changed
+keys to each subscriber. Checking the version is a single read from shared
+memory, so the watcher costs next to nothing while nothing changes, and it
+works the same whether the server is a thread or a separate process.
+
+Each subscriber has a bounded queue of pending updates. A client that
+falls behind by more than max_pending updates is dropped; it can reconnect
+and starts again from a full snapshot.
+
+The hub also remembers the snapshot version at which each key last changed
+(or disappeared), which is what GET /?since=N answers from. The snapshot
+version goes up with every publish, so it serves as the global version.
+Whoever notices a new version first, the watcher or a request, applies it
+for everyone.
+"""
+import json
+import logging
+import threading
+import time
+from collections import deque
+
+
+class Subscriber:
+    def __init__(self, keys=None, max_pending=256):
+        self.keys = frozenset(keys) if keys else None
+        self.max_pending = max_pending
+        self.dropped = False
+        self.closed = False
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+
+    def select(self, values):
+        """The part of values this subscriber asked for."""
+        if self.keys is None:
+            return values
+        return {key: values[key] for key in self.keys if key in values}
+
+    def push(self, changed):
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                self.dropped = True
+            else:
+                self._pending.append(changed)
+            # Under the lock, so a get() that already took this update
+            # can't be woken for it again and find nothing
+            self._ready.set()
+
+    def close(self):
+        self.closed = True
+        self._ready.set()
+
+    def get(self, timeout=None):
+        """
+        Wait for updates and return them merged into one dict, or None if
+        the timeout passed, nothing was pending, the subscriber was dropped or
+        the hub closed.
+        """
+        if not self._ready.wait(timeout):
+            return None
+        with self._lock:
+            self._ready.clear()
+            if self.dropped or self.closed:
+                return None
+            pending, self._pending = self._pending, deque()
+        if not pending:
+            return None
+        if len(pending) == 1:
+            return pending[0]
+        merged = {}
+        for changed in pending:
+            merged.update(changed)
+        return merged
+
+
+class UpdateHub:
+    def __init__(self, snapshot, poll_interval=0.002, max_pending=256):
+        self.snapshot = snapshot
+        self.poll_interval = poll_interval
+        self.max_pending = max_pending
+        self.values = {}
+        self.version = None
+        self.key_versions = {}  # key -> version it last changed at, oldest first
+        self.removed = {}       # key -> version it disappeared at
+        self.first_version = None  # history before this is unknown
+        self.published = 0
+        self.dropped = 0
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._watcher = None
+        self._closed = False
+
+    def subscribe(self, keys=None):
+        """Register a client. Returns (subscriber, current values it asked for)."""
+        subscriber = Subscriber(keys, self.max_pending)
+        with self._lock:
+            if self._closed:
+                subscriber.close()
+                return subscriber, {}
+            if self._watcher is None:
+                self._update()
+                self._watcher = threading.Thread(target=self._watch, name="Update hub", daemon=True)
+                self._watcher.start()
+            self._subscribers.add(subscriber)
+            initial = subscriber.select(self.values)
+        logging.debug(f"Stream client subscribed ({len(self._subscribers)} connected).")
+        return subscriber, initial
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+            remaining = len(self._subscribers)
+        if subscriber.dropped:
+            self.dropped += 1
+            logging.warning("Dropped a stream client that fell behind.")
+        logging.debug(f"Stream client left ({remaining} connected).")
+
+    def close(self):
+        """End every stream and the watcher, e.g. because the server stops."""
+        with self._lock:
+            self._closed = True
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.close()
+
+    def changes_since(self, since, timeout=0):
+        """
+        Return (version, {key: value} changed after version since, [keys
+        removed after it], full). full is True when since is older than the
+        hub's history (or not a version it knows), in which case values are
+        all current values and replace whatever the client had. With a
+        timeout, wait up to that many seconds for something to change first.
+        """
+        result = self._changes_since(since)
+        if result[1] or result[2] or result[3] or timeout <= 0:
+            return result
+        # Subscribing keeps the watcher running and wakes us on the next change
+        subscriber, _ = self.subscribe()
+        try:
+            deadline = time.monotonic() + timeout
+            while True:
+                result = self._changes_since(since)
+                remaining = deadline - time.monotonic()
+                if result[1] or result[2] or remaining <= 0 or subscriber.closed:
+                    return result
+                subscriber.get(remaining)
+        finally:
+            self.unsubscribe(subscriber)
+
+    def _changes_since(self, since):
+        with self._lock:
+            self._update()
+            full = since == 0 or since < self.first_version or since > self.version
+            if full:
+                since = -1
+            values = {}
+            for key, version in reversed(self.key_versions.items()):
+                if version <= since:
+                    break
+                values[key] = self.values[key]
+            removed = [key for key, version in self.removed.items() if version > since]
+            return self.version, values, removed, full
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_interval)
+            with self._lock:
+                if self._closed or not self._subscribers:
+                    # Restarted by the next subscribe() unless closed
+                    self._watcher = None
+                    return
+                self._update()
+
+    def _update(self):
+        """Apply a new snapshot, if there is one, and push what changed. Call with the lock held."""
+        if self.snapshot.version == self.version:
+            return
+        changed = self._refresh()
+        if changed:
+            self.published += 1
+            for subscriber in self._subscribers:
+                selected = subscriber.select(changed)
+                if selected:
+                    subscriber.push(selected)
+
+    def _refresh(self):
+        """Read the latest snapshot, stamp the keys that changed and return them."""
+        version, body = self.snapshot.read()
+        values = json.loads(body) if body else {}
+        previous = self.values
+        changed = {key: value for key, value in values.items() if key not in previous or previous[key] != value}
+
+        key_versions = self.key_versions
+        added = 0
+        for key in changed:
+            if key_versions.pop(key, None) is None:
+                added += 1
+            key_versions[key] = version
+            self.removed.pop(key, None)
+        if len(previous) + added > len(values):
+            for key in previous.keys() - values.keys():
+                del key_versions[key]
+                self.removed[key] = version
+
+        if self.first_version is None:
+            self.first_version = version
+        self.version = version
+        self.values = values
+        return changed
@@ -0,0 +1,117 @@
+"""
+Typed channel values.
+
+Values arrive as text (``key:value`` lines, posted JSON strings) or as
+numbers (the binary protocol, posted JSON numbers). parse_value() turns
+text into a bool, int or float once, at ingest, so the app, the history
+and every client work on real numbers: the published JSON carries
+``"temp":21.5`` instead of ``"temp":"21.5"``.
+
+ChannelTypes infers one type per channel from its values. A channel takes
+the type of its first value; an int channel that gets a float becomes a
+float channel, and its later ints are stored as floats so clients see one
+type. A value that doesn't fit a numeric channel at all (an ``ERR`` from a
+sensor) is kept as it came, and a string channel stores numbers as text.
+
+values_differ() compares two typed values the way clients see them, with
+an optional numeric tolerance.
+"""
+import math
+
+TYPE_NAMES = {bool: "bool", int: "int", float: "float", str: "string"}
+
+_BOOLS = {"true": True, "false": False}
+
+
+def parse_value(text):
+    """The value of text as a bool, int or float, or text itself if it's none of them."""
+    if not isinstance(text, str):
+        return text
+    lowered = text.lower()
+    if lowered in _BOOLS:
+        return _BOOLS[lowered]
+    if not text or "_" in text:
+        # int() and float() accept digit separators; sketches never send them
+        return text
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+
+def json_safe(value):
+    """value, with NaN and infinities (which JSON can't carry) as None."""
+    if type(value) is float and not math.isfinite(value):
+        return None
+    return value
+
+
+def format_value(value):
+    """A value as the table shows it: the way JSON writes it, without quotes."""
+    if type(value) is bool:
+        return "true" if value else "false"
+    return str(value)
+
+
+def values_differ(old, new, tolerance=0.0):
+    """
+    Whether new is a different value from old: of another type, or for
+    numbers, more than tolerance apart. Two NaNs are the same value.
+    """
+    old_kind = type(old)
+    new_kind = type(new)
+    if old_kind is not new_kind:
+        # 1 == True == 1.0 in Python, but not on the wire
+        if not (old_kind in (int, float) and new_kind in (int, float)):
+            return True
+    elif old == new:
+        return False
+    if new_kind is bool or new_kind not in (int, float):
+        return old != new
+    if new != new and old != old:
+        return False
+    return not abs(new - old) <= tolerance
+
+
+class ChannelTypes:
+    """The inferred type of every channel."""
+
+    def __init__(self):
+        self.types = {}      # key -> bool, int, float or str
+        self.mismatches = 0  # values kept as they came because they didn't fit
+
+    def type_name(self, key):
+        kind = self.types.get(key)
+        return TYPE_NAMES[kind] if kind else None
+
+    def coerce(self, key, value):
+        """value (already parsed) as the channel's type, inferring or widening the type."""
+        kind = self.types.get(key)
+        if type(value) is kind:
+            return value
+        if kind is None:
+            kind = type(value)
+            if kind not in TYPE_NAMES:
+                kind = str
+                value = str(value)
+            self.types[key] = kind
+            return value
+
+        value_kind = type(value)
+        if kind is float and value_kind is int:
+            return float(value)
+        if kind is int and value_kind is float:
+            self.types[key] = float
+            return value
+        if kind is str:
+            return format_value(value)
+        self.mismatches += 1
+        return value
+
+    def clear(self):
+        self.types.clear()
+        self.mismatches = 0
@@ -0,0 +1,285 @@
+"""
+Minimal WebSocket (RFC 6455) support for the local server.
+
+Werkzeug's development server, which both server modes run on, does not
+speak WebSocket itself, but it passes the request's socket to the
+application as environ["werkzeug.socket"]. upgrade() answers the handshake
+on that socket and returns a WebSocket; the request thread then owns the
+connection until it closes, and the view returns UpgradedResponse() so no
+HTTP response is written after it. connect() is the matching client, for
+tests and scripts.
+
+Only what the dashboard needs is implemented: text and binary messages,
+fragmented messages, ping/pong and the closing handshake. There are no
+extensions (no compression) and no subprotocols.
+"""
+import base64
+import hashlib
+import os
+import socket
+import struct
+import threading
+
+from werkzeug.wrappers import Response
+
+GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+CLOSE_NORMAL = 1000
+CLOSE_GOING_AWAY = 1001
+CLOSE_PROTOCOL_ERROR = 1002
+CLOSE_NO_STATUS = 1005
+CLOSE_INVALID_DATA = 1007
+CLOSE_TOO_BIG = 1009
+CLOSE_TRY_AGAIN = 1013
+
+MAX_MESSAGE = 1 << 20  # bytes
+
+
+class WebSocketError(Exception):
+    """A peer broke the protocol; code is the close code to answer with."""
+
+    def __init__(self, message, code=CLOSE_PROTOCOL_ERROR):
+        super().__init__(message)
+        self.code = code
+
+
+def accept_key(key):
+    return base64.b64encode(hashlib.sha1(key.encode('ascii') + GUID).digest()).decode('ascii')
+
+
+def mask_payload(payload, mask):
+    """XOR payload with the 4-byte mask (masking and unmasking are the same)."""
+    size = len(payload)
+    if not size:
+        return b""
+    key = (mask * (size // 4 + 1))[:size]
+    return (int.from_bytes(payload, "little") ^ int.from_bytes(key, "little")).to_bytes(size, "little")
+
+
+def encode_frame(opcode, payload, mask=False):
+    """One final frame. Clients must mask what they send, servers must not."""
+    length = len(payload)
+    first = 0x80 | opcode
+    mask_bit = 0x80 if mask else 0
+    if length < 126:
+        header = struct.pack("!BB", first, mask_bit | length)
+    elif length < 1 << 16:
+        header = struct.pack("!BBH", first, mask_bit | 126, length)
+    else:
+        header = struct.pack("!BBQ", first, mask_bit | 127, length)
+    if mask:
+        key = os.urandom(4)
+        return header + key + mask_payload(payload, key)
+    return header + payload
+
+
+class WebSocket:
+    """
+    One open connection. receive() belongs to a single thread; send(),
+    ping() and close() may be called from any thread.
+    """
+
+    def __init__(self, sock, client=False, max_message=MAX_MESSAGE):
+        self.sock = sock
+        self.client = client
+        self.max_message = max_message
+        self.closed = False
+        self.close_code = None
+        self._file = sock.makefile("rb")
+        self._send_lock = threading.Lock()
+        # Small frames go out immediately instead of waiting for an ACK
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    # --------------------------------------------------------------------
+    # Sending
+    # --------------------------------------------------------------------
+    def send(self, message):
+        """Send str as a text message and bytes as a binary one. Returns False once closed."""
+        if isinstance(message, str):
+            return self._send_frame(OP_TEXT, message.encode('utf-8'))
+        return self._send_frame(OP_BINARY, bytes(message))
+
+    def ping(self, payload=b""):
+        return self._send_frame(OP_PING, payload)
+
+    def _send_frame(self, opcode, payload):
+        frame = encode_frame(opcode, payload, mask=self.client)
+        with self._send_lock:
+            if self.closed:
+                return False
+            try:
+                self.sock.sendall(frame)
+            except OSError:
+                self.closed = True
+                return False
+        return True
+
+    def close(self, code=CLOSE_NORMAL, reason=""):
+        """
+        Send a close frame (once) and shut the socket down, which also ends
+        a receive() blocked on another thread.
+        """
+        with self._send_lock:
+            if self.closed:
+                return
+            self.closed = True
+            if self.close_code is None:
+                self.close_code = code
+            payload = b"" if code == CLOSE_NO_STATUS else struct.pack("!H", code) + reason.encode('utf-8')[:123]
+            try:
+                self.sock.sendall(encode_frame(OP_CLOSE, payload, mask=self.client))
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            if self.client:
+                self.sock.close()
+
+    # --------------------------------------------------------------------
+    # Receiving
+    # --------------------------------------------------------------------
+    def receive(self):
+        """
+        Block for the next message: str for text, bytes for binary, or None
+        once the connection is closed. Pings are answered on the way.
+        """
+        message = None
+        opcode = None
+        try:
+            while True:
+                fin, frame_opcode, payload = self._read_frame()
+                if frame_opcode == OP_PING:
+                    self._send_frame(OP_PONG, payload)
+                    continue
+                if frame_opcode == OP_PONG:
+                    continue
+                if frame_opcode == OP_CLOSE:
+                    code = struct.unpack("!H", payload[:2])[0] if len(payload) >= 2 else CLOSE_NO_STATUS
+                    self.close_code = code
+                    self.close(code)
+                    return None
+
+                if frame_opcode == OP_CONTINUATION:
+                    if message is None:
+                        raise WebSocketError("Continuation frame without a message")
+                    message += payload
+                elif frame_opcode in (OP_TEXT, OP_BINARY):
+                    if message is not None:
+                        raise WebSocketError("New message before the previous one finished")
+                    opcode, message = frame_opcode, bytearray(payload)
+                else:
+                    raise WebSocketError(f"Unknown opcode {frame_opcode}")
+
+                if len(message) > self.max_message:
+                    raise WebSocketError("Message too big", CLOSE_TOO_BIG)
+                if fin:
+                    if opcode == OP_BINARY:
+                        return bytes(message)
+                    try:
+                        return message.decode('utf-8')
+                    except UnicodeDecodeError:
+                        raise WebSocketError("Text message is not UTF-8", CLOSE_INVALID_DATA)
+        except WebSocketError as e:
+            self.close(e.code, str(e))
+        except (EOFError, OSError, ValueError):
+            # Peer went away, or close() shut the socket from another thread
+            self.close(CLOSE_NO_STATUS)
+        return None
+
+    def _read_exactly(self, size):
+        data = self._file.read(size)
+        if data is None or len(data) < size:
+            raise EOFError
+        return data
+
+    def _read_frame(self):
+        first, second = self._read_exactly(2)
+        if first & 0x70:
+            raise WebSocketError("Reserved bits set without an extension")
+        fin = bool(first & 0x80)
+        opcode = first & 0x0F
+        masked = bool(second & 0x80)
+        length = second & 0x7F
+        if length == 126:
+            length = struct.unpack("!H", self._read_exactly(2))[0]
+        elif length == 127:
+            length = struct.unpack("!Q", self._read_exactly(8))[0]
+
+        if masked == self.client:
+            raise WebSocketError("Frames from a client must be masked and from a server must not")
+        if opcode >= OP_CLOSE and (length > 125 or not fin):
+            raise WebSocketError("Control frames must be short and unfragmented")
+        if length > self.max_message:
+            raise WebSocketError("Message too big", CLOSE_TOO_BIG)
+
+        mask = self._read_exactly(4) if masked else None
+        payload = self._read_exactly(length)
+        if mask:
+            payload = mask_payload(payload, mask)
+        return fin, opcode, payload
+
+
+# --------------------------------------------------------------------
+# Handshake
+# --------------------------------------------------------------------
+def upgrade(environ):
+    """
+    Answer a WebSocket handshake on the request's socket and return the
+    WebSocket, or None if the request is not a valid upgrade or the server
+    does not expose its socket.
+    """
+    sock = environ.get("werkzeug.socket")
+    key = environ.get("HTTP_SEC_WEBSOCKET_KEY")
+    if (sock is None or not key
+            or environ.get("HTTP_UPGRADE", "").lower() != "websocket"
+            or "upgrade" not in environ.get("HTTP_CONNECTION", "").lower()
+            or environ.get("HTTP_SEC_WEBSOCKET_VERSION") != "13"):
+        return None
+    sock.sendall(("HTTP/1.1 101 Switching Protocols\r\n"
+                  "Upgrade: websocket\r\n"
+                  "Connection: Upgrade\r\n"
+                  f"Sec-WebSocket-Accept: {accept_key(key)}\r\n\r\n").encode('ascii'))
+    return WebSocket(sock)
+
+
+class UpgradedResponse(Response):
+    """
+    What a view returns after serving a WebSocket. Raising ConnectionError
+    makes werkzeug end the request quietly instead of writing an HTTP
+    response onto the finished connection.
+    """
+
+    def __call__(self, environ, start_response):
+        raise ConnectionError("WebSocket closed")
+
+
+def connect(host, port, path="/ws", timeout=5):
+    """Open a client WebSocket to ws://host:port/path."""
+    sock = socket.create_connection((host, port), timeout)
+    key = base64.b64encode(os.urandom(16)).decode('ascii')
+    sock.sendall((f"GET {path} HTTP/1.1\r\n"
+                  f"Host: {host}:{port}\r\n"
+                  "Upgrade: websocket\r\n"
+                  "Connection: Upgrade\r\n"
+                  f"Sec-WebSocket-Key: {key}\r\n"
+                  "Sec-WebSocket-Version: 13\r\n\r\n").encode('ascii'))
+    ws = WebSocket(sock, client=True)
+    status = ws._file.readline().decode('latin-1')
+    headers = {}
+    while True:
+        line = ws._file.readline().decode('latin-1').strip()
+        if not line:
+            break
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    if status.split()[1:2] != ["101"] or headers.get("sec-websocket-accept") != accept_key(key):
+        sock.close()
+        raise ConnectionError(f"WebSocket handshake with {host}:{port}{path} failed: {status.strip()}")
+    sock.settimeout(None)
+    return ws
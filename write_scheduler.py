@@ -0,0 +1,149 @@
+"""
+Coalescing write scheduler for values posted to the Arduino.
+"""
+import logging
+import time
+
+
+class WriteScheduler:
+    """
+    Collects the values waiting to be written to each target (a board) and
+    hands them out as one packed ``key:value\\n`` payload per flush.
+
+    Only the newest value per key is kept; a value that is replaced before it
+    was written is counted as coalesced. A value dropped with discard()
+    because the board already has it is counted as discarded instead.
+
+    Writes are paced per target by a token bucket at what the serial link can
+    carry (8N1 framing, so baud_rate / 10 bytes per second), allowing bursts
+    of up to burst_interval seconds of link time; whatever does not fit stays
+    pending for later.
+
+    A group submitted with submit_group() is written in one payload, in the
+    order given, and is never split across writes by the pacing.
+    """
+
+    def __init__(self, baud_rate, burst_interval=0.5):
+        self.bytes_per_second = baud_rate / 10
+        self.burst_bytes = max(64, int(self.bytes_per_second * burst_interval))
+        self._pending = {}    # target -> {key: (wire_key, value, posted_at, group)}
+        self._allowance = {}  # target -> (bytes, monotonic time)
+        self._groups = 0
+
+        self.queued = 0
+        self.coalesced = 0
+        self.discarded = 0
+        self.values_sent = 0
+        self.bytes_sent = 0
+
+    def submit(self, target, key, wire_key, value, posted_at=None):
+        """
+        Queue a value for target, replacing any unsent value for the same key.
+        A replaced value that was part of a group leaves the new one in its
+        place in the group.
+        """
+        pending = self._pending.setdefault(target, {})
+        group = None
+        entry = pending.get(key)
+        if entry is not None:
+            self.coalesced += 1
+            group = entry[3]
+        pending[key] = (wire_key, value, posted_at, group)
+        self.queued += 1
+
+    def submit_group(self, target, entries, posted_at=None):
+        """
+        Queue (key, wire_key, value) entries for target to be written
+        together, after everything already pending and in this order.
+        """
+        pending = self._pending.setdefault(target, {})
+        self._groups += 1
+        for key, wire_key, value in entries:
+            # Move the key to the end so the group stays in one piece
+            if pending.pop(key, None) is not None:
+                self.coalesced += 1
+            pending[key] = (wire_key, value, posted_at, self._groups)
+        self.queued += len(entries)
+
+    def discard(self, target, key):
+        """Drop an unsent value, e.g. because the board already has it."""
+        pending = self._pending.get(target)
+        if pending and pending.pop(key, None) is not None:
+            self.discarded += 1
+
+    def available(self, target, now=None):
+        """Bytes target's link can take right now."""
+        now = time.monotonic() if now is None else now
+        allowance, updated_at = self._allowance.get(target, (self.burst_bytes, now))
+        return min(self.burst_bytes, allowance + (now - updated_at) * self.bytes_per_second)
+
+    def next_batch(self, target, now=None):
+        """
+        Return (payload, items) for the next write to target, where items is a
+        list of (key, value, posted_at) in the payload; empty if the link has
+        no room yet. Nothing is removed until sent() is called, so a failed
+        write is simply retried later.
+        """
+        budget = self.available(target, now)
+        payload = bytearray()
+        items = []
+        unit = bytearray()
+        unit_items = []
+        unit_group = None
+        # A unit is one line, or a whole group; units are taken whole or not at all
+        for key, (wire_key, value, posted_at, group) in self._pending.get(target, {}).items():
+            if unit_items and (group is None or group != unit_group):
+                if not self._fits(payload, unit, budget):
+                    return bytes(payload), items
+                payload += unit
+                items += unit_items
+                unit = bytearray()
+                unit_items = []
+            unit += f"{wire_key}:{value}\n".encode('utf-8')
+            unit_items.append((key, value, posted_at))
+            unit_group = group
+        if unit_items and self._fits(payload, unit, budget):
+            payload += unit
+            items += unit_items
+        return bytes(payload), items
+
+    def _fits(self, payload, unit, budget):
+        # A unit longer than a whole burst goes out alone once the bucket is full
+        return len(payload) + len(unit) <= budget or (not payload and budget >= self.burst_bytes)
+
+    def sent(self, target, items, byte_count, now=None):
+        """Remove the written items unless a newer value arrived meanwhile."""
+        now = time.monotonic() if now is None else now
+        self._allowance[target] = (self.available(target, now) - byte_count, now)
+        pending = self._pending.get(target, {})
+        for key, value, _ in items:
+            entry = pending.get(key)
+            if entry is not None and entry[1] is value:
+                del pending[key]
+        self.values_sent += len(items)
+        self.bytes_sent += byte_count
+
+    def targets(self):
+        return [target for target, pending in self._pending.items() if pending]
+
+    def forget(self, target):
+        self._allowance.pop(target, None)
+        dropped = len(self._pending.pop(target, {}))
+        if dropped:
+            logging.warning(f"Dropped {dropped} unsent values for a closed connection.")
+
+    @property
+    def backlog(self):
+        return sum(len(pending) for pending in self._pending.values())
+
+    @property
+    def stats(self):
+        return {
+            "queued": self.queued,
+            "coalesced": self.coalesced,
+            "discarded": self.discarded,
+            "sent": self.values_sent,
+            "bytes_sent": self.bytes_sent,
+            "backlog": self.backlog,
+            "burst_bytes": self.burst_bytes,
+        }